@@ -1,7 +1,17 @@
 import numpy as np
+import hashlib
 import math
-from scipy.interpolate import interp1d
+import sqlite3
+from bisect import bisect_right
+from collections import namedtuple, OrderedDict
+from copy import deepcopy
+from functools import lru_cache, partial
+from scipy.interpolate import interp1d, CubicSpline, PchipInterpolator, RBFInterpolator
 from scipy.integrate import solve_ivp
+from scipy.optimize import brentq, differential_evolution, NonlinearConstraint, OptimizeResult
+from scipy.sparse import diags, bmat
+from scipy.special import erf
+from scipy.stats import qmc
 from statistics import mean
 
 def get_mass_rover(rover):
@@ -50,10 +60,28 @@ def get_local_atm_properties(planet, altitude):
     #  [density, temperature, pressure] = get_local_atm_properties(planet, altitude)
     #  also returns the local pressure in KPa.
     #
-    # Note: this function is NOT vectorized. It will not accept a vector of
-    # altitudes.
-    
-    if altitude > planet['altitude_threshold']:
+    # altitude may be a scalar (including a 0-d numpy array) or an array
+    # (list or numpy array) of altitudes, e.g. a whole EDL trajectory Y[1,:];
+    # for an array each output is an array of the same shape.
+    #
+    # If the planet carries a tabulated atmosphere (planet['atmosphere'], see
+    # AtmosphereTable) the properties are interpolated from it.
+    
+    if np.ndim(altitude) > 0:
+        altitude = np.asarray(altitude, dtype=float)
+    elif isinstance(altitude, np.ndarray):
+        # 0-d array: treat as a scalar and return scalars
+        altitude = altitude.item()
+    
+    if 'atmosphere' in planet:
+        return planet['atmosphere'](altitude)
+    
+    if np.ndim(altitude) > 0:
+       # evaluate both models and pick per altitude
+       high = altitude > planet['altitude_threshold']
+       temperature = np.where(high, planet['high_altitude']['temperature'](altitude), planet['low_altitude']['temperature'](altitude))
+       pressure = np.where(high, planet['high_altitude']['pressure'](altitude), planet['low_altitude']['pressure'](altitude))
+    elif altitude > planet['altitude_threshold']:
        temperature = planet['high_altitude']['temperature'](altitude) 
        pressure = planet['high_altitude']['pressure'](altitude)
     else:
@@ -64,6 +92,116 @@ def get_local_atm_properties(planet, altitude):
     
     return density, temperature, pressure
 
+class AtmosphereTable:
+    """
+    Tabulated version of the analytic atmosphere of a planet dict.
+
+    Inputs:    planet:  dict              Planet from define_planet (uses the
+                                          altitude_threshold, low_altitude,
+                                          high_altitude and density entries)
+              alt_min:  scalar            (optional) Lowest tabulated
+                                          altitude [m]
+              alt_max:  scalar            (optional) Highest tabulated
+                                          altitude [m]
+                 rtol:  scalar            (optional) Bound on the relative
+                                          error of the interpolated density,
+                                          temperature and pressure [-]
+
+    Calling the table with an altitude [m] (scalar or numpy array) returns
+    (density, temperature, pressure) like get_local_atm_properties.
+
+    Density, temperature and pressure are tabulated on a uniform grid on
+    each side of altitude_threshold (the temperature model jumps there) and
+    linearly interpolated. The grid is halved until the interpolation error
+    at every interval midpoint is within rtol; the analytic models have
+    second derivatives of constant sign over each interval, so the midpoint
+    is where the linear interpolation error peaks and rtol bounds the error
+    everywhere in [alt_min, alt_max]. The worst error found is kept in
+    max_error. Outside [alt_min, alt_max] the analytic models are used.
+    """
+
+    __slots__ = ('threshold', 'alt_min', 'alt_max', 'models', 'density', 'tables', 'max_error')
+
+    def __init__(self, planet, alt_min=-1000.0, alt_max=25000.0, rtol=1e-8):
+
+        self.threshold = planet['altitude_threshold']
+        self.alt_min = alt_min
+        self.alt_max = alt_max
+        self.models = (planet['low_altitude'], planet['high_altitude'])
+        self.density = planet['density']
+
+        # one table for each side of the threshold:
+        # (first altitude, 1/spacing, altitudes, 3xN values, rows as lists)
+        self.tables = []
+        self.max_error = 0.0
+        for model, a, b in ((self.models[0], alt_min, self.threshold),
+                            (self.models[1], self.threshold, alt_max)):
+            n = 64
+            while True:
+                alt = np.linspace(a, b, n+1)
+                vals = self.analytic(model, alt)
+                exact = self.analytic(model, 0.5*(alt[:-1] + alt[1:]))
+                err = np.max(np.abs(0.5*(vals[:,:-1] + vals[:,1:]) - exact)/np.abs(exact))
+                if err <= rtol:
+                    break
+                n = 2*n
+            self.max_error = max(self.max_error, err)
+            self.tables.append((a, n/(b - a), alt, vals, vals.T.tolist()))
+
+    def analytic(self, model, altitude):
+
+        temperature = model['temperature'](altitude)
+        pressure = model['pressure'](altitude)
+
+        return np.array([self.density(temperature, pressure), temperature, pressure])
+
+    def __call__(self, altitude):
+
+        if np.ndim(altitude) > 0:
+            return self.lookup_array(altitude)
+
+        altitude = float(altitude) # plain float arithmetic is much faster than numpy scalars
+        high = altitude > self.threshold
+        if altitude < self.alt_min or altitude > self.alt_max:
+            density, temperature, pressure = self.analytic(self.models[high], altitude)
+            return density, temperature, pressure
+
+        a, inv_h, _, _, rows = self.tables[high]
+        u = (altitude - a)*inv_h
+        ii = int(u)
+        if ii > len(rows) - 2:
+            ii = len(rows) - 2
+        w = u - ii
+        r0 = rows[ii]
+        r1 = rows[ii+1]
+
+        return r0[0] + w*(r1[0] - r0[0]), r0[1] + w*(r1[1] - r0[1]), r0[2] + w*(r1[2] - r0[2])
+
+    def __reduce_ex__(self, protocol):
+        # the shared Mars table is not sent to worker processes (it is most
+        # of a pickled planet); they use their own mars_atmosphere_table()
+        if self is mars_atmosphere_table():
+            return (mars_atmosphere_table, ())
+        return super().__reduce_ex__(protocol)
+
+    def lookup_array(self, altitude):
+
+        shape = np.shape(altitude)
+        alt = np.atleast_1d(np.asarray(altitude, dtype=float))
+        out = np.empty((3,) + alt.shape)
+
+        high = alt > self.threshold
+        outside = (alt < self.alt_min) | (alt > self.alt_max)
+        for side, mask in ((0, ~high), (1, high)):
+            _, _, grid, vals, _ = self.tables[side]
+            for k in range(3):
+                out[k][mask] = np.interp(alt[mask], grid, vals[k])
+            if np.any(mask & outside):
+                out[:, mask & outside] = self.analytic(self.models[side], alt[mask & outside])
+
+        out = out.reshape((3,) + shape)
+        return out[0], out[1], out[2]
+
 def get_gear_ratio(speed_reducer):
     """
     Inputs:  speed_reducer:  dict      Data dictionary specifying speed
@@ -146,16 +284,38 @@ def get_cost_edl(edl_system):
     
     return total_cost
 
-def define_planet():
+# Models of the Mars atmosphere used by define_planet. They are named
+# functions rather than lambdas so that a planet dict can be pickled (e.g. to
+# send it to worker processes).
+def mars_high_temperature(altitude):
+    return -23.4 - 0.00222*altitude # [C]
+
+def mars_low_temperature(altitude):
+    return -31 - 0.000998*altitude # [C]
+
+def mars_pressure(altitude):
+    return 0.699*np.exp(-0.00009*altitude) # [KPa]
+
+def mars_density(temperature, pressure):
+    return pressure/(0.1921*(temperature+273.15)) # [kg/m^3]
+
+def define_planet(tabulated=True):
+    
+    # tabulated=True (default) adds planet['atmosphere'], an AtmosphereTable
+    # of the models below, which get_local_atm_properties and the EDL
+    # right-hand side then interpolate. Its density, temperature and
+    # pressure are within 1e-8 relative of the models, but that is enough
+    # to move EDL event times and ITER_INFO output in the 4th decimal.
+    # tabulated=False leaves it out, and everything uses the analytic models.
     
 
-    high_altitude = {'temperature' : lambda altitude: -23.4 - 0.00222*altitude, # [C]
-                     'pressure' : lambda altitude: 0.699*np.exp(-0.00009*altitude)} # [KPa]
+    high_altitude = {'temperature' : mars_high_temperature, # [C]
+                     'pressure' : mars_pressure} # [KPa]
                                                                 
-    low_altitude = {'temperature' : lambda altitude: -31 - 0.000998*altitude, # [C]
-                    'pressure' : lambda altitude: 0.699*np.exp(-0.00009*altitude)} # [KPa]
+    low_altitude = {'temperature' : mars_low_temperature, # [C]
+                    'pressure' : mars_pressure} # [KPa]
     
-    density = lambda temperature, pressure: pressure/(0.1921*(temperature+273.15)) # [kg/m^3]
+    density = mars_density # [kg/m^3]
     
     mars = {'g' : -3.72,   # m/s^2]
             'altitude_threshold' : 7000, # [m]
@@ -163,9 +323,21 @@ def define_planet():
             'high_altitude' : high_altitude,
             'density' : density}
     
+    if tabulated:
+        mars['atmosphere'] = mars_atmosphere_table()
+    
     #del high_altitude, low_altitude, density
     return mars
 
+@lru_cache(maxsize=None)
+def mars_atmosphere_table():
+    
+    # AtmosphereTable of the define_planet models. Building it takes ~5 ms,
+    # so it is built on first use and shared by every later define_planet
+    # call in the process (the table is never modified).
+    
+    return AtmosphereTable(define_planet(tabulated=False))
+
 def define_rover():
     # Initialize Rover dict 
     wheel = {'radius':0.30,
@@ -280,7 +452,23 @@ def define_mission_events():
     mission_events = {'alt_heatshield_eject' : 8000,
                       'alt_parachute_eject' : 900,
                       'alt_rockets_on' : 1800,
-                      'alt_skycrane_on' : 7.6}
+                      'alt_skycrane_on' : 7.6,
+                      # largest solver step [s] in each phase of the
+                      # descent (see edl_phase). This is deliberately not
+                      # "loose in the parachute descent, tight in the PID
+                      # phases": benchmark_edl_max_step.py shows that a
+                      # 1.0 s cap in the descent moves the heat shield and
+                      # parachute events enough to give a landing time
+                      # error of ~8e-3 s (vs ~3e-4 s at 0.1 s), while the
+                      # speed controller is smooth and DOP853 stays
+                      # accurate with 0.5 s steps. With this table the
+                      # landing time and touchdown speed match uniform
+                      # 0.1 s steps with 15-52% fewer RHS calls. Position
+                      # control and the sky crane keep 0.1 s
+                      'max_step' : {'descent' : 0.1,
+                                    'full_thrust' : 0.5,
+                                    'speed_control' : 0.5,
+                                    'position_control' : 0.1}}
     
     return mission_events
 
@@ -474,10 +662,12 @@ def define_motor(edl_system, motor_type):
     
     return edl_system
 
-def tau_dcmotor(omega, motor):
+def tau_dcmotor(omega, motor, out=None):
     """
     Inputs:  omega:  numpy array      Motor shaft speed [rad/s]
              motor:  dict             Data dictionary specifying motor parameters
+               out:  numpy array      (optional) Preallocated float array, same
+                                      size as omega, that receives the result
     Outputs:   tau:  numpy array      Torque at motor shaft [Nm].  Return argument
                                       is same size as first input argument.
     """
@@ -501,35 +691,46 @@ def tau_dcmotor(omega, motor):
     tau_nl   = motor['torque_noload']
     omega_nl = motor['speed_noload']
     
-    # initialize
-    tau = np.zeros(len(omega),dtype = float)
-    for ii in range(len(omega)):
-        if omega[ii] >= 0 and omega[ii] <= omega_nl:
-            tau[ii] = tau_s - (tau_s-tau_nl)/omega_nl *omega[ii]
-        elif omega[ii] < 0:
-            tau[ii] = tau_s
-        elif omega[ii] > omega_nl:
-            tau[ii] = 0
+    # Check the output buffer, if one was given
+    if out is None:
+        out = np.empty(len(omega), dtype = float)
+    elif (not isinstance(out, np.ndarray)) or out.dtype != float or out.shape != np.shape(omega):
+        raise Exception('out must be a float numpy array the same size as the first input.')
+
+    # beyond no-load speed (and NaN speeds) the torque is zero. Work out the
+    # mask first, since out may be the same array as omega
+    above_nl = ~(omega <= omega_nl)
+
+    # clipping at 0 gives the stall torque for negative speeds and clipping at
+    # omega_nl keeps the linear branch in range
+    np.clip(omega, 0, omega_nl, out = out)
+    out *= -(tau_s-tau_nl)/omega_nl
+    out += tau_s
+    out[above_nl] = 0
         
-    return tau
+    return out
 
-def F_buoyancy_descent(edl_system,planet,altitude):
+def F_buoyancy_descent(edl_system,planet,altitude,density=None):
     
-    # Compute the net buoyancy force. 
+    # Compute the net buoyancy force. density may be passed in if the caller
+    # already has it.
     
-    density, _, _ = get_local_atm_properties(planet, altitude)
+    if density is None:
+        density, _, _ = get_local_atm_properties(planet, altitude)
     
     F = np.sign(planet['g'])*planet['g']*density*edl_system['volume']
     
     return F
 
-def F_drag_descent(edl_system,planet,altitude,velocity):
+def F_drag_descent(edl_system,planet,altitude,velocity,density=None):
     
-    # Compute the net drag force. 
+    # Compute the net drag force. density may be passed in if the caller
+    # already has it.
     
     
     # compute the density of planetary atmosphere at current altitude
-    density, _, _ = get_local_atm_properties(planet, altitude)
+    if density is None:
+        density, _, _ = get_local_atm_properties(planet, altitude)
     
     # This is the (1/2)*density*velocity^2 part of the drag model. The missing
     # bit is area*Cd, which we'll figure out below.
@@ -568,6 +769,164 @@ def F_gravity_descent(edl_system,planet):
 
     return F
 
+class PchipFit:
+    """
+    PCHIP interpolant with a fast path for scalar arguments, which is how
+    the EDL right-hand side calls it.
+
+    Inputs:         x:  numpy array       Increasing data points
+                    y:  numpy array       Values at x
+
+    Arrays go through scipy; a scalar is a bisection plus a Horner
+    evaluation of the same piecewise cubic (extrapolated with the end
+    polynomials, as scipy does).
+    """
+
+    __slots__ = ('fit', 'x', 'knots', 'rows')
+
+    def __init__(self, x, y):
+
+        self.fit = PchipInterpolator(x, y)
+        self.x = self.fit.x
+        self.knots = self.fit.x.tolist()
+        self.rows = self.fit.c.T.tolist() # one [c3, c2, c1, c0] row per interval
+
+    def __call__(self, xi):
+
+        if isinstance(xi, (np.ndarray, list, tuple)):
+            return self.fit(xi)
+
+        ii = bisect_right(self.knots, xi) - 1
+        if ii < 0:
+            ii = 0
+        elif ii > len(self.rows) - 1:
+            ii = len(self.rows) - 1
+
+        dx = xi - self.knots[ii]
+        c3, c2, c1, c0 = self.rows[ii]
+
+        return ((c3*dx + c2)*dx + c1)*dx + c0
+
+@lru_cache(maxsize=None)
+def speed_of_sound_fit():
+    
+    # PCHIP fit of the speed of sound on Mars [m/s] versus altitude [m].
+    # The data are constant, so the fit is built on first use and reused.
+    
+    SPD_data = np.array([[0, 244.4], [1000, 243.7], [2000, 243.2], [3000, 242.7], [4000, 242.2],
+                         [5000, 241.7], [6000, 241.2], [7000, 240.7], [8000, 239.6], [9000, 238.4],
+                         [10000, 237.3], [11000, 236.1], [12000, 235.0], [13000, 233.8], [14000, 232.6]])
+    
+    return PchipFit(SPD_data[:, 0], SPD_data[:, 1])
+
+def v2M_Mars(v, a):
+    
+    # Mach number of speed v [m/s] at altitude a [m] on Mars
+    
+    return abs(v)/speed_of_sound_fit()(a)
+
+# Parachute Mach efficiency factor (MEF) data: measured parachute Cd
+# multiplier versus Mach number
+MEF_M_DATA = np.array([0.25, 0.5, 0.65, 0.7, 0.8, 0.9, 0.95, 1.0,
+                       1.1, 1.2, 1.3, 1.4, 1.5, 1.6, 1.8, 1.9,
+                       2.0, 2.2, 2.5, 2.6])
+
+MEF_DATA = np.array([1.0, 1.0, 1.0, 0.97, 0.91, 0.72, 0.66, 0.75,
+                     0.90, 0.96, 0.990, 0.999, 0.992, 0.98, 0.91, 0.85,
+                     0.82, 0.75, 0.64, 0.62])
+
+class TabulatedMachDrag:
+    """
+    Drag model with the parachute Cd scaled by a factor tabulated against
+    Mach number.
+
+    Inputs:    M_data:  numpy array       Mach numbers of the table [-]
+          factor_data:  numpy array       Parachute Cd multiplier at each
+                                          Mach number [-]
+
+    Called like F_drag_descent. The parachute uses Cd_mod = factor(M)*Cd,
+    with factor a PCHIP (shape preserving) fit of the table built once here
+    and M clipped to the table; the body drag is unchanged. An instance
+    holds nothing but its fit, so it can be sent to worker processes.
+    """
+
+    __slots__ = ('fit',)
+
+    def __init__(self, M_data, factor_data):
+
+        self.fit = PchipFit(M_data, factor_data)
+
+    def factor(self, M):
+
+        # clip the Mach number to the table, no extrapolation
+        if isinstance(M, (np.ndarray, list, tuple)):
+            M = np.clip(M, self.fit.x[0], self.fit.x[-1])
+        else:
+            M = min(max(M, self.fit.knots[0]), self.fit.knots[-1])
+
+        return self.fit(M)
+
+    def __call__(self, edl_system, planet, altitude, velocity, density=None):
+
+        if density is None:
+            density, _, _ = get_local_atm_properties(planet, altitude)
+
+        rhov2 = 0.5*density*velocity**2
+
+        # body drag, as in F_drag_descent
+        if not edl_system['heat_shield']['ejected']:
+            ACd_body = np.pi*(edl_system['heat_shield']['diameter']/2.0)**2*edl_system['heat_shield']['Cd']
+        else:
+            ACd_body = edl_system['sky_crane']['area']*edl_system['sky_crane']['Cd']
+
+        # parachute drag with the Mach-dependent Cd
+        if edl_system['parachute']['deployed'] and not edl_system['parachute']['ejected']:
+            Cd_mod = self.factor(v2M_Mars(velocity, altitude))*edl_system['parachute']['Cd']
+            ACd_parachute = np.pi*(edl_system['parachute']['diameter']/2.0)**2*Cd_mod
+        else:
+            ACd_parachute = 0.0
+
+        F = rhov2*(ACd_body + ACd_parachute)
+
+        return F
+
+# Mach-dependent parachute drag: the tabulated model on the MEF data
+F_drag_descent_Mach = TabulatedMachDrag(MEF_M_DATA, MEF_DATA)
+
+def mach_efficiency_factor(M):
+    
+    # Parachute Mach efficiency factor MEF(M), from the shape-preserving
+    # fit of the MEF data
+    
+    return F_drag_descent_Mach.factor(M)
+
+# Drag models by name, for simulate_edl / edl_dynamics. A drag model is any
+# callable with the F_drag_descent signature
+# (edl_system, planet, altitude, velocity, density=None) -> drag force [N];
+# other Cd tables can be passed as TabulatedMachDrag(M_data, factor_data).
+DRAG_MODELS = {'constant_cd' : F_drag_descent,
+               'mach' : F_drag_descent_Mach}
+
+def get_drag_model(drag_model, edl_system):
+    
+    # Resolves the drag_model argument of simulate_edl / edl_dynamics: a name
+    # from DRAG_MODELS, a callable, or None (Mach model if
+    # edl_system['parachute']['use_mach_model'] is set, constant Cd
+    # otherwise).
+    
+    if drag_model is None:
+        if edl_system['parachute'].get('use_mach_model', False):
+            return F_drag_descent_Mach
+        return F_drag_descent
+    
+    if callable(drag_model):
+        return drag_model
+    
+    if drag_model in DRAG_MODELS:
+        return DRAG_MODELS[drag_model]
+    
+    raise Exception('drag_model must be None, a callable or one of {}'.format(list(DRAG_MODELS)))
+
 def F_gravity(terrain_angle, rover, planet):
     """
     Inputs:  terrain_angle:  numpy array   Array of terrain angles [deg]
@@ -588,7 +947,7 @@ def F_gravity(terrain_angle, rover, planet):
         raise Exception('First input must be a scalar or a vector. Matrices are not allowed.')
         
     # Check that values of the first input are within the feasible range  
-    if max([abs(x) for x in terrain_angle]) > 75:    
+    if np.max(np.abs(terrain_angle)) > 75:    
         raise Exception('All elements of the first input must be between -75 degrees and +75 degrees')
 
     # Check that the second input is a dict
@@ -603,7 +962,7 @@ def F_gravity(terrain_angle, rover, planet):
     m = get_mass_rover(rover)
     g = planet['g']
     
-    Fgt = np.array([-m*g*math.sin(math.radians(x)) for x in terrain_angle], dtype = float)
+    Fgt = -m*g*np.sin(np.radians(terrain_angle))
         
     return Fgt
 
@@ -678,7 +1037,7 @@ def F_rollingCorr(omega, terrain_angle, rover, planet, Crr):
         raise Exception('First two inputs must be the same size')
     
     # Check that values of the second input are within the feasible range  
-    if max([abs(x) for x in terrain_angle]) > 75:    
+    if np.max(np.abs(terrain_angle)) > 75:    
         raise Exception('All elements of the second input must be between -75 degrees and +75 degrees')
         
     # Check that the third input is a dict
@@ -706,11 +1065,11 @@ def F_rollingCorr(omega, terrain_angle, rover, planet, Crr):
     # compute rolling resistance
     Crr = np.sqrt(0.0005/r) + 0.05
     
-    Fn = np.array([m*g*math.cos(math.radians(x)) for x in terrain_angle],dtype=float) # normal force
+    Fn = m*g*np.cos(np.radians(terrain_angle)) # normal force
     
     Frr_simple = -Crr*Fn # simple rolling resistance
     
-    Frr = np.array([math.erf(40*v_rover[ii]) * Frr_simple[ii] for ii in range(len(v_rover))], dtype = float)
+    Frr = erf(40*v_rover) * Frr_simple
     
     return Frr
 
@@ -750,7 +1109,7 @@ def F_net(omega, terrain_angle, rover, planet, Crr):
         raise Exception('First two inputs must be the same size')
     
     # Check that values of the second input are within the feasible range  
-    if max([abs(x) for x in terrain_angle]) > 75:    
+    if np.max(np.abs(terrain_angle)) > 75:    
         raise Exception('All elements of the second input must be between -75 degrees and +75 degrees')
         
     # Check that the third input is a dict
@@ -776,6 +1135,94 @@ def F_net(omega, terrain_angle, rover, planet, Crr):
     
     return Fnet
 
+def F_net_scalar(omega, terrain_angle, params, g):
+    """
+    Inputs:           omega:  scalar          Motor shaft speed [rad/s]
+              terrain_angle:  scalar          Terrain angle [deg]
+                     params:  RoverParams     Output of compile_rover
+                          g:  scalar          Gravitational acceleration of
+                                              the planet [m/s^2]
+    
+    Outputs:           Fnet:  scalar          Net force [N]
+    
+    Scalar version of F_net for use inside ODE right-hand sides. It does no
+    input checking and allocates no arrays, so inputs must have been
+    validated beforehand (simulate_rover does this once by calling F_net).
+    Same model as F_drive, F_rollingCorr and F_gravity, including the
+    radius-based rolling resistance coefficient of F_rollingCorr.
+    """
+    
+    m = params.mass
+    Ng = params.Ng
+    r = params.r
+    
+    # motor torque (same piecewise curve as tau_dcmotor)
+    if omega < 0:
+        tau = params.tau_s
+    elif omega <= params.omega_nl:
+        tau = params.tau_s - (params.tau_s-params.tau_nl)/params.omega_nl *omega
+    else:
+        tau = 0.0
+    
+    # drive force for all six wheels
+    Fd = 6*(tau*Ng/r)
+    
+    # rolling resistance
+    v_rover = r*omega/Ng
+    Crr = math.sqrt(0.0005/r) + 0.05
+    angle = math.radians(terrain_angle)
+    Frr = math.erf(40*v_rover) * (-Crr*(m*g*math.cos(angle)))
+    
+    # gravity
+    Fg = -m*g*math.sin(angle)
+    
+    Fnet = Fd - Frr - Fg
+    
+    return Fnet
+
+def F_net_array(omega, terrain_angle, params, g):
+    """
+    Inputs:           omega:  numpy array     Motor shaft speed of each design
+                                              [rad/s]
+              terrain_angle:  numpy array     Terrain angle under each design
+                                              [deg]
+                     params:  RoverParams     Output of compile_rover_batch:
+                                              every field is an array with
+                                              one entry per design
+                          g:  scalar          Gravitational acceleration of
+                                              the planet [m/s^2]
+    
+    Outputs:           Fnet:  numpy array     Net force on each design [N]
+    
+    Elementwise version of F_net_scalar for many rover designs at once. No
+    input checking.
+    """
+    
+    m = params.mass
+    Ng = params.Ng
+    r = params.r
+    
+    # motor torque (same piecewise curve as tau_dcmotor)
+    tau = params.tau_s - (params.tau_s-params.tau_nl)/params.omega_nl *omega
+    tau = np.where(omega < 0, params.tau_s, tau)
+    tau = np.where(omega > params.omega_nl, 0.0, tau)
+    
+    # drive force for all six wheels
+    Fd = 6*(tau*Ng/r)
+    
+    # rolling resistance
+    v_rover = r*omega/Ng
+    Crr = np.sqrt(0.0005/r) + 0.05
+    angle = np.radians(terrain_angle)
+    Frr = erf(40*v_rover) * (-Crr*(m*g*np.cos(angle)))
+    
+    # gravity
+    Fg = -m*g*np.sin(angle)
+    
+    Fnet = Fd - Frr - Fg
+    
+    return Fnet
+
 def motorW(v, rover):
     """
     Inputs:               v:  numpy array     Array of velocities [m/s]
@@ -836,7 +1283,7 @@ def mechpower(v, rover):
     
     return P
 
-def battenergy(t,v,rover):
+def battenergy(t,v,rover,params=None):
     """
     Inputs:               t:  numpy array     Array of time samples from a 
                                               rover simulation [s]
@@ -844,6 +1291,9 @@ def battenergy(t,v,rover):
                                               simulation [m/s]
                       rover:  dict            Data structure specifying rover 
                                               parameters
+                     params:  RoverParams     (optional) Output of
+                                              compile_rover. Its efficiency
+                                              spline is reused when given
     
     Outputs:              E:  scalar          Total electrical energy consumed 
                                               from the rover battery pack over
@@ -871,9 +1321,12 @@ def battenergy(t,v,rover):
     tau = tau_dcmotor(omega, rover['wheel_assembly']['motor']) # calculate torque (used for efficiency info)
     
     # Determine efficiency for each time/velocity
-    effcy_tau = rover['wheel_assembly']['motor']['effcy_tau'].ravel() # change to 1D array
-    effcy = rover['wheel_assembly']['motor']['effcy'].ravel()
-    effcy_fun = interp1d(effcy_tau, effcy, kind = 'cubic', fill_value = 'extrapolate') # fit the cubic spline
+    if params is not None and params.effcy_fun is not None:
+        effcy_fun = params.effcy_fun # spline already fitted by compile_rover
+    else:
+        effcy_tau = rover['wheel_assembly']['motor']['effcy_tau'].ravel() # change to 1D array
+        effcy = rover['wheel_assembly']['motor']['effcy'].ravel()
+        effcy_fun = interp1d(effcy_tau, effcy, kind = 'cubic', fill_value = 'extrapolate') # fit the cubic spline
     effcy_dat = effcy_fun(tau)
     
     
@@ -893,7 +1346,132 @@ def battenergy(t,v,rover):
     
     return E
 
-def rover_dynamics(t, y, rover, planet, experiment):
+class TerrainProfile:
+    """
+    Cubic spline of terrain angle versus distance, built once per experiment.
+
+    Inputs:  alpha_dist:  numpy array     Distances at which the terrain angle
+                                          is specified [m]
+              alpha_deg:  numpy array     Terrain angle at each distance [deg]
+
+    Calling the profile with a position returns the terrain angle [deg]. It
+    reproduces interp1d(alpha_dist, alpha_deg, kind='cubic',
+    fill_value='extrapolate'): same not-a-knot spline, same extrapolation of
+    the end polynomials. The per-interval polynomial coefficients are
+    precomputed, so a scalar lookup is a bisection plus a Horner evaluation.
+    """
+
+    __slots__ = ('dist', 'coeffs', 'spline')
+
+    def __init__(self, alpha_dist, alpha_deg):
+
+        self.spline = CubicSpline(np.asarray(alpha_dist, dtype=float).ravel(),
+                                  np.asarray(alpha_deg, dtype=float).ravel())
+
+        # plain Python lists so the scalar path never touches numpy
+        self.dist = self.spline.x.tolist()
+        self.coeffs = self.spline.c.T.tolist() # one [c3, c2, c1, c0] row per interval
+
+    def __call__(self, pos):
+
+        if isinstance(pos, np.ndarray):
+            return self.spline(pos)
+
+        # find the interval, clamping so positions outside the knots use the
+        # end polynomials (extrapolation)
+        ii = bisect_right(self.dist, pos) - 1
+        if ii < 0:
+            ii = 0
+        elif ii > len(self.coeffs) - 1:
+            ii = len(self.coeffs) - 1
+
+        dx = pos - self.dist[ii]
+        c3, c2, c1, c0 = self.coeffs[ii]
+
+        return ((c3*dx + c2)*dx + c1)*dx + c0
+
+    def derivative(self, pos):
+        """
+        Slope of the terrain angle with position, d(alpha)/dx [deg/m], at pos.
+        Uses the same interval lookup and end-polynomial extrapolation as
+        calling the profile.
+        """
+
+        if isinstance(pos, np.ndarray):
+            return self.spline(pos, 1)
+
+        ii = bisect_right(self.dist, pos) - 1
+        if ii < 0:
+            ii = 0
+        elif ii > len(self.coeffs) - 1:
+            ii = len(self.coeffs) - 1
+
+        dx = pos - self.dist[ii]
+        c3, c2, c1, c0 = self.coeffs[ii]
+
+        return (3*c3*dx + 2*c2)*dx + c1
+
+class RoverParams:
+    """
+    Flat record of the rover quantities that stay constant during a
+    simulation. Built by compile_rover.
+
+    Fields:        mass:  scalar          Total rover mass [kg]
+                     Ng:  scalar          Speed reducer gear ratio [-]
+                      r:  scalar          Wheel radius [m]
+                  tau_s:  scalar          Motor stall torque [Nm]
+                 tau_nl:  scalar          Motor no-load torque [Nm]
+               omega_nl:  scalar          Motor no-load speed [rad/s]
+              effcy_fun:  interp1d        Motor efficiency versus torque
+                                          (None if the motor has no
+                                          efficiency data)
+    """
+
+    __slots__ = ('mass', 'Ng', 'r', 'tau_s', 'tau_nl', 'omega_nl', 'effcy_fun')
+
+    def __init__(self, mass, Ng, r, tau_s, tau_nl, omega_nl, effcy_fun):
+
+        self.mass = mass
+        self.Ng = Ng
+        self.r = r
+        self.tau_s = tau_s
+        self.tau_nl = tau_nl
+        self.omega_nl = omega_nl
+        self.effcy_fun = effcy_fun
+
+def compile_rover(rover):
+    """
+    Inputs:     rover:  dict              Data structure specifying rover
+                                          parameters
+
+    Outputs:   params:  RoverParams       Constant rover quantities (mass, gear
+                                          ratio, wheel radius, motor curve and
+                                          efficiency spline) pulled out of the
+                                          nested dict once
+    """
+
+    # Check that the rover input is a dict
+    if type(rover) != dict:
+        raise Exception('rover input must be a dict')
+
+    motor = rover['wheel_assembly']['motor']
+
+    if 'effcy_tau' in motor and 'effcy' in motor:
+        effcy_fun = interp1d(motor['effcy_tau'].ravel(), motor['effcy'].ravel(), kind = 'cubic', fill_value = 'extrapolate')
+    else:
+        effcy_fun = None
+
+    params = RoverParams(get_mass_rover(rover),
+                         get_gear_ratio(rover['wheel_assembly']['speed_reducer']),
+                         rover['wheel_assembly']['wheel']['radius'],
+                         motor['torque_stall'],
+                         motor['torque_noload'],
+                         motor['speed_noload'],
+                         effcy_fun)
+
+    return params
+
+def rover_dynamics(t, y, rover, planet, experiment, terrain=None, params=None):
     """
     Inputs:         t:  scalar            Time sample [s]
                     y:  numpy array       Two element array of dependent variables 
@@ -906,6 +1484,14 @@ def rover_dynamics(t, y, rover, planet, experiment):
                                           parameters
            experiment:  dict              Data dictionary specifying experiment 
                                           definition
+              terrain:  TerrainProfile    (optional) Terrain profile built from
+                                          experiment. Built on the fly if not
+                                          given
+               params:  RoverParams       (optional) Output of compile_rover.
+                                          When given, the forces come from the
+                                          unchecked F_net_scalar, so the
+                                          inputs must already be validated
+                                          (as simulate_rover does)
     
     Outputs:     dydt:  numpy array       First derivatives of state vector. 
                                           First element is rover acceleration 
@@ -944,17 +1530,90 @@ def rover_dynamics(t, y, rover, planet, experiment):
     v = float(y[0]) # velocity
     pos = float(y[1]) # position
     
-    omega = motorW(v, rover)   
-    alpha_fun = interp1d(experiment['alpha_dist'].ravel(), experiment['alpha_deg'].ravel(), kind = 'cubic', fill_value="extrapolate")
-    terrain_angle = float(alpha_fun(pos))
-    F = F_net(omega, terrain_angle, rover, planet, experiment['Crr'])
+    if terrain is None:
+        terrain = TerrainProfile(experiment['alpha_dist'], experiment['alpha_deg'])
+    terrain_angle = float(terrain(pos))
+    
+    if params is None:
+        # called on its own: go through the checked, dict-based functions
+        omega = motorW(v, rover)   
+        F = F_net(omega, terrain_angle, rover, planet, experiment['Crr'])
+        m = get_mass_rover(rover)
+    else:
+        # called from simulate_rover, which has already validated the inputs
+        omega = v*params.Ng/params.r # same as motorW, without the dict walk
+        F = F_net_scalar(omega, terrain_angle, params, planet['g'])
+        m = params.mass
     
-    m = get_mass_rover(rover)
     accel = float(F/m)
     dydt = np.array([accel, v], dtype = float)
     
     return dydt
 
+def rover_jacobian(t, y, rover, planet, experiment, terrain, params):
+    """
+    Inputs:         t:  scalar            Time sample [s]
+                    y:  numpy array       Two element state vector (rover
+                                          velocity [m/s], position [m])
+                rover:  dict              Data structure specifying rover 
+                                          parameters
+               planet:  dict              Data dictionary specifying planetary 
+                                          parameters
+           experiment:  dict              Data dictionary specifying experiment 
+                                          definition
+              terrain:  TerrainProfile    Terrain profile built from experiment
+               params:  RoverParams       Output of compile_rover
+    
+    Outputs:        J:  numpy array       2x2 Jacobian of rover_dynamics with
+                                          respect to y
+    
+    Analytic Jacobian of the rover_dynamics right-hand side, for the implicit
+    solver in simulate_rover. Differentiates the same model as F_net_scalar:
+    d(accel)/dv goes through the motor torque curve and the erf term of the
+    rolling resistance, d(accel)/dx through the slope of the terrain spline.
+    No input checking (same contract as F_net_scalar).
+    """
+    
+    v = float(y[0]) # velocity
+    pos = float(y[1]) # position
+    
+    m = params.mass
+    Ng = params.Ng
+    r = params.r
+    g = planet['g']
+    
+    omega = v*Ng/r
+    angle = math.radians(terrain(pos))
+    dangle_dx = math.radians(terrain.derivative(pos)) # [rad/m]
+    
+    # slope of the motor torque curve (flat outside the linear range)
+    if 0 <= omega <= params.omega_nl:
+        dtau_domega = -(params.tau_s-params.tau_nl)/params.omega_nl
+    else:
+        dtau_domega = 0.0
+    
+    # drive force: Fd = 6*tau*Ng/r, omega = v*Ng/r
+    dFd_dv = 6*(Ng/r)*dtau_domega*(Ng/r)
+    
+    # rolling resistance: Frr = erf(40*v)*(-Crr*m*g*cos(angle))
+    Crr = math.sqrt(0.0005/r) + 0.05
+    v_rover = r*omega/Ng
+    erf_v = math.erf(40*v_rover)
+    dFrr_dv = 80/math.sqrt(math.pi)*math.exp(-(40*v_rover)**2) * (-Crr*m*g*math.cos(angle))
+    dFrr_dangle = erf_v * (Crr*m*g*math.sin(angle))
+    
+    # gravity: Fg = -m*g*sin(angle)
+    dFg_dangle = -m*g*math.cos(angle)
+    
+    # Fnet = Fd - Frr - Fg
+    dF_dv = dFd_dv - dFrr_dv
+    dF_dx = (-dFrr_dangle - dFg_dangle)*dangle_dx
+    
+    J = np.array([[dF_dv/m, dF_dx/m],
+                  [1.0, 0.0]])
+    
+    return J
+
 def end_of_mission_event(end_event):
     """
     Defines an event that terminates the mission simulation. Mission is over
@@ -990,7 +1649,229 @@ def end_of_mission_event(end_event):
     
     return events
 
-def simulate_rover(rover,planet,experiment,end_event):
+def terminal_velocity(terrain_angle, params, g):
+    """
+    Inputs:  terrain_angle:  scalar          Terrain angle [deg]
+                    params:  RoverParams     Output of compile_rover
+                         g:  scalar          Gravitational acceleration of
+                                             the planet [m/s^2]
+    
+    Outputs:        v_term:  scalar          Rover speed at which F_net is zero
+                                             on this slope [m/s], or None if
+                                             there is no such speed (rover
+                                             cannot climb the slope, or keeps
+                                             accelerating down it)
+    
+    Root of F_net_scalar in rover speed. No input checking.
+    """
+    
+    Fnet = lambda v: F_net_scalar(v*params.Ng/params.r, terrain_angle, params, g)
+    
+    if Fnet(0.0) <= 0:
+        return None
+    
+    # no-load speed bounds the root unless the slope is steep enough to push
+    # the rover past it; try a few multiples before giving up
+    v_hi = params.omega_nl*params.r/params.Ng
+    for ii in range(4):
+        if Fnet(v_hi) < 0:
+            return brentq(Fnet, 0.0, v_hi, xtol=1e-12)
+        v_hi = 10*v_hi
+    
+    return None
+
+def rover_quasi_steady(rover, planet, experiment, end_event, terrain, params, options, tol=1e-3, angle_tol=0.05):
+    """
+    Inputs:     rover:  dict              Data structure specifying rover 
+                                          parameters
+               planet:  dict              Data dictionary specifying planetary 
+                                          parameters
+           experiment:  dict              Data dictionary specifying experiment 
+                                          definition
+            end_event:  dict              Data dictionary containing the 
+                                          conditions to terminate the
+                                          simulation
+              terrain:  TerrainProfile    Terrain profile built from experiment
+               params:  RoverParams       Output of compile_rover
+              options:  dict              solve_ivp options for the transients
+                                          (method, rtol, atol, max_step)
+                  tol:  scalar            (optional) Relative distance from
+                                          terminal speed at which a transient
+                                          is considered settled [-]
+            angle_tol:  scalar            (optional) Largest change of the
+                                          terrain angle allowed within one
+                                          constant-slope segment [deg]
+    
+    Outputs:      sol:  OptimizeResult    t, y (2xN: velocity, position) and
+                                          nfev, like the solve_ivp result used
+                                          by simulate_rover
+    
+    Semi-analytic rover traversal. The terrain is replaced by constant
+    slopes: each knot interval is split into equal segments until the
+    terrain angle changes by at most angle_tol within a segment, and each
+    segment gets the mean angle of the spline over it. On each slope the
+    rover's terminal speed is found by root-solving F_net = 0.
+    
+    Between v_lin (erf term of the rolling resistance saturated) and the
+    motor no-load speed, F_net is linear in speed, so on a constant slope
+    the rover relaxes exponentially to terminal speed with a fixed time
+    constant; those stretches are stitched together in closed form. The
+    ODE is only integrated outside that range (e.g. starts from rest), and
+    once such a transient is within tol of terminal speed the rest of the
+    segment is crossed at terminal speed. Stops on the same conditions as
+    end_of_mission_event (and at the end of experiment['time_range']).
+    No input checking (simulate_rover validates).
+    """
+    
+    g = planet['g']
+    t_end = min(float(experiment['time_range'][1]), float(end_event['max_time']))
+    x_max = float(end_event['max_distance'])
+    v_min = float(end_event['min_velocity'])
+    
+    # piecewise constant terrain. One mean slope per knot interval is not
+    # enough: terminal speed is nonlinear in the slope, and with a single
+    # segment per 100 m interval the telemetry was off by up to ~4%. The
+    # last segment is stretched over any distance past the final knot.
+    seg_x = [terrain.dist[0]]
+    seg_angle = []
+    for xa, xb in zip(terrain.dist[:-1], terrain.dist[1:]):
+        probe = terrain.spline(np.linspace(xa, xb, 65))
+        n = max(1, int(math.ceil((probe.max() - probe.min())/angle_tol)))
+        edges = np.linspace(xa, xb, n + 1)
+        for ea, eb in zip(edges[:-1], edges[1:]):
+            seg_angle.append(terrain.spline.integrate(ea, eb)/(eb - ea))
+        seg_x.extend(edges[1:].tolist())
+    if x_max > seg_x[-1]:
+        seg_x[-1] = x_max
+    
+    # linear range of F_net in speed: erf(40*v) is 1 to within 2e-8 above
+    # 0.1 m/s, and the motor curve is linear up to the no-load speed. There
+    # dv/dt = (v_term - v)/tau_v with tau_v = m/(6*(Ng/r)^2*(tau_s - tau_nl)/omega_nl)
+    v_lin = max(0.1, v_min)
+    v_nl = params.omega_nl*params.r/params.Ng
+    if params.tau_s > params.tau_nl:
+        tau_v = params.mass*params.omega_nl/(6*(params.Ng/params.r)**2*(params.tau_s - params.tau_nl))
+    else:
+        tau_v = None
+    
+    t = float(experiment['time_range'][0])
+    v, x = [float(val) for val in experiment['initial_conditions'].ravel()]
+    T = [t]
+    Y = [[v, x]]
+    nfev = 0
+    
+    done = (v <= v_min) or (x >= x_max) or (t >= t_end)
+    ii = min(max(bisect_right(seg_x, x) - 1, 0), len(seg_angle) - 1)
+    while not done:
+        
+        angle = seg_angle[ii]
+        x_seg = seg_x[ii+1] if ii < len(seg_angle) - 1 else x_max
+        x_seg = min(x_seg, x_max)
+        v_term = terminal_velocity(angle, params, g)
+        linear = (tau_v is not None) and (v_term is not None) and (v_lin < v_term <= v_nl)
+        settled = False
+        
+        while x < x_seg and not done:
+            
+            if linear and v_lin < v <= v_nl:
+                # exponential relaxation to v_term, exact in this range
+                v0, x0 = v, x
+                pos = lambda dt: x0 + v_term*dt + (v0 - v_term)*tau_v*(1 - math.exp(-dt/tau_v))
+                dt_seg = brentq(lambda dt: pos(dt) - x_seg, 0.0, (x_seg - x0)/min(v0, v_term))
+                dt = min(dt_seg, t_end - t)
+                
+                # sample every tau_v/8 until settled, so battenergy's
+                # trapezoidal rule sees the transient
+                dv = abs(v0 - v_term)
+                n = int(math.ceil(8*math.log(dv/(tol*v_term)))) if dv > tol*v_term else 0
+                for kk in range(1, n + 1):
+                    dt_k = 0.125*kk*tau_v
+                    if dt_k >= dt:
+                        break
+                    T.append(t + dt_k)
+                    Y.append([v_term + (v0 - v_term)*math.exp(-dt_k/tau_v), pos(dt_k)])
+                
+                v = v_term + (v0 - v_term)*math.exp(-dt/tau_v)
+                x = x_seg if dt == dt_seg else pos(dt)
+                t = t + dt
+                T.append(t)
+                Y.append([v, x])
+                if dt < dt_seg:
+                    done = True # out of time
+                break
+            
+            if settled or (v_term is not None and abs(v - v_term) <= tol*v_term):
+                # settled: cross the rest of the interval at terminal speed
+                v = v_term
+                dt = (x_seg - x)/v
+                if t + dt >= t_end:
+                    x = x + v*(t_end - t)
+                    t = t_end
+                    done = True
+                else:
+                    x = x_seg
+                    t = t + dt
+                T.append(t)
+                Y.append([v, x])
+                break
+            
+            # transient at constant slope, until settled, end of interval,
+            # too slow or out of time
+            fun = lambda t,y: np.array([F_net_scalar(y[0]*params.Ng/params.r, angle, params, g)/params.mass, y[0]])
+            at_end = lambda t,y: x_seg - y[1]
+            at_end.terminal = True
+            too_slow = lambda t,y: y[0] - v_min
+            too_slow.terminal = True
+            events = [at_end, too_slow]
+            if v_term is not None:
+                near_term = lambda t,y: abs(y[0] - v_term) - tol*v_term
+                near_term.terminal = True
+                near_term.direction = -1
+                events.append(near_term)
+            
+            sol = solve_ivp(fun, (t, t_end), [v, x], events=events, **options)
+            nfev += sol.nfev
+            T.extend(sol.t[1:])
+            Y.extend(sol.y[:,1:].T.tolist())
+            t = float(sol.t[-1])
+            v, x = float(sol.y[0,-1]), float(sol.y[1,-1])
+            
+            if sol.status != 1 or sol.t_events[1].size > 0:
+                done = True # out of time, or below min_velocity
+            elif sol.t_events[0].size > 0:
+                x = x_seg
+            else:
+                settled = True # the event root can land a hair outside tol
+        
+        if x >= x_max:
+            done = True
+        ii = ii + 1
+        if ii > len(seg_angle) - 1:
+            done = True
+    
+    return OptimizeResult(t=np.array(T), y=np.array(Y).T, nfev=nfev)
+
+# solve_ivp presets for simulate_rover. The rover ODE is stiff (the erf
+# rolling term and the motor curve), so the explicit methods need ~10^5
+# RHS calls on experiment1; all presets use implicit methods.
+#   fast:     fewest RHS calls, coarse output grid
+#   accurate: tight tolerances on a dense grid
+#   stiff:    the original BDF setting, and the default
+# benchmark_solver_profiles.py reports their cost and telemetry error.
+ROVER_SOLVER_PROFILES = {'fast' : {'method' : 'LSODA',
+                                   'rtol' : 1e-3,
+                                   'atol' : 1e-6,
+                                   'max_step' : np.inf},
+                         'accurate' : {'method' : 'Radau',
+                                       'rtol' : 1e-8,
+                                       'atol' : 1e-10,
+                                       'max_step' : 1.0},
+                         'stiff' : {'method' : 'BDF',
+                                    'rtol' : 1e-3,
+                                    'atol' : 1e-6,
+                                    'max_step' : 1.0}}
+
+def simulate_rover(rover,planet,experiment,end_event,profile='stiff',mode='ode'):
     """
     Inputs:     rover:  dict              Data structure specifying rover 
                                           parameters
@@ -1002,6 +1883,22 @@ def simulate_rover(rover,planet,experiment,end_event):
                                           conditions necessary and sufficient 
                                           to terminate simulation of rover 
                                           dynamics                 
+              profile:  string or dict    (optional) Name of a solver preset
+                                          in ROVER_SOLVER_PROFILES ('fast',
+                                          'accurate' or 'stiff'), or a dict
+                                          of solve_ivp options (method, rtol,
+                                          atol, max_step)
+                 mode:  string            (optional) 'ode' integrates the full
+                                          rover ODE. 'quasi_steady' uses
+                                          rover_quasi_steady: piecewise
+                                          constant terrain, terminal speed per
+                                          slope, closed-form transients.
+                                          Approximate: within ~1e-4 of a
+                                          tight-tolerance ODE solve on
+                                          experiment1 designs, but unchecked
+                                          on other terrain; see
+                                          rover_mode_error. The optimizer
+                                          constraints always use 'ode'
     
     Outputs:    rover:  dict              Updated rover structure including 
                                           telemetry information
@@ -1022,18 +1919,46 @@ def simulate_rover(rover,planet,experiment,end_event):
     if type(end_event) != dict:
         raise Exception('end_event input must be a dict')
     
+    # Look up the solver settings
+    if type(profile) == dict:
+        options = dict(profile)
+    elif profile in ROVER_SOLVER_PROFILES:
+        options = dict(ROVER_SOLVER_PROFILES[profile])
+    else:
+        raise Exception('profile must be one of {} or a dict of solve_ivp options'.format(list(ROVER_SOLVER_PROFILES)))
+    method = options.pop('method', 'BDF')
+    
+    if mode not in ('ode', 'quasi_steady'):
+        raise Exception("mode must be 'ode' or 'quasi_steady'")
+    
     # Main Code
-    fun = lambda t,y: rover_dynamics(t, y, rover, planet, experiment) # differential equation
+    terrain = TerrainProfile(experiment['alpha_dist'], experiment['alpha_deg']) # built once, not per RHS call
+    params = compile_rover(rover) # constant rover quantities, also built once
+    fun = lambda t,y: rover_dynamics(t, y, rover, planet, experiment, terrain, params) # differential equation
+    if method in ('BDF', 'Radau', 'LSODA'):
+        # saves the implicit solvers from finite-differencing fun
+        options['jac'] = lambda t,y: rover_jacobian(t, y, rover, planet, experiment, terrain, params)
     t_span = experiment['time_range'] # time span
     y0 = experiment['initial_conditions'].ravel() # initial conditions
+    
+    # rover_dynamics uses the unchecked F_net_scalar when given params, so
+    # run the full F_net input checks once here: initial speed and every
+    # terrain angle the experiment specifies
+    alpha_deg = np.asarray(experiment['alpha_deg'], dtype = float).ravel()
+    omega0 = motorW(y0[0:1], rover)
+    F_net(np.full(len(alpha_deg), omega0[0]), alpha_deg, rover, planet, experiment['Crr'])
     events = end_of_mission_event(end_event) # stopping criteria
-    sol = solve_ivp(fun, t_span, y0, method = 'BDF', events=events, max_step=1.0) #t_eval=(np.linspace(0, 3000, 1000)))  # need a stiff solver like BDF
+    if mode == 'quasi_steady':
+        options.pop('jac', None) # the transients run on constant slopes
+        sol = rover_quasi_steady(rover, planet, experiment, end_event, terrain, params, dict(options, method = method))
+    else:
+        sol = solve_ivp(fun, t_span, y0, method = method, events=events, **options) #t_eval=(np.linspace(0, 3000, 1000)))  # need a stiff solver like BDF
     
     # extract necessary data
     v_max = max(sol.y[0,:])
     v_avg = mean(sol.y[0,:])
     P = mechpower(sol.y[0,:], rover)
-    E = battenergy(sol.t,sol.y[0,:],rover)
+    E = battenergy(sol.t,sol.y[0,:],rover,params)
     
     # Add telemetry info to rover dict
     telemetry = {'Time' : sol.t,
@@ -1045,11 +1970,457 @@ def simulate_rover(rover,planet,experiment,end_event):
                  'average_velocity' : v_avg,
                  'power' : P,
                  'battery_energy' : E,
-                 'energy_per_distance' : E/sol.y[1,-1]}
+                 'energy_per_distance' : E/sol.y[1,-1],
+                 'solver_nfev' : sol.nfev}
     
     rover['telemetry'] = telemetry
     return rover
 
+def compile_rover_batch(rovers):
+    """
+    Inputs:    rovers:  list              Rover dicts, one per design
+    
+    Outputs:   params:  list              compile_rover output for each design
+                batch:  RoverParams       The same quantities stacked into
+                                          arrays (one entry per design, no
+                                          efficiency spline)
+    """
+    
+    params = [compile_rover(rover) for rover in rovers]
+    
+    fields = ['mass', 'Ng', 'r', 'tau_s', 'tau_nl', 'omega_nl']
+    stacked = [np.array([getattr(p, field) for p in params], dtype = float) for field in fields]
+    batch = RoverParams(*stacked, None)
+    
+    return params, batch
+
+def rover_dynamics_batch(t, y, terrain, batch, g, active):
+    """
+    Inputs:         t:  scalar            Time sample [s]
+                    y:  numpy array       Stacked state vector: velocities of
+                                          all N designs [m/s], then their
+                                          positions [m]
+              terrain:  TerrainProfile    Terrain profile built from experiment
+                batch:  RoverParams       Output of compile_rover_batch
+                    g:  scalar            Gravitational acceleration of the
+                                          planet [m/s^2]
+               active:  numpy array       Boolean mask of designs still
+                                          driving; the others are frozen
+    
+    Outputs:     dydt:  numpy array       Stacked first derivatives
+                                          (accelerations, then velocities)
+    
+    rover_dynamics for N designs at once. No input checking.
+    """
+    
+    N = len(active)
+    v = y[:N]
+    pos = y[N:]
+    
+    omega = v*batch.Ng/batch.r
+    accel = F_net_array(omega, terrain(pos), batch, g)/batch.mass
+    
+    dydt = np.concatenate((np.where(active, accel, 0.0), np.where(active, v, 0.0)))
+    
+    return dydt
+
+def rover_jacobian_batch(t, y, terrain, batch, g, active):
+    """
+    Inputs:         same as rover_dynamics_batch
+    
+    Outputs:        J:  sparse matrix     Jacobian of rover_dynamics_batch,
+                                          block diagonal in the designs
+    
+    Elementwise version of rover_jacobian. No input checking.
+    """
+    
+    N = len(active)
+    v = y[:N]
+    pos = y[N:]
+    
+    m = batch.mass
+    Ng = batch.Ng
+    r = batch.r
+    
+    omega = v*Ng/r
+    angle = np.radians(terrain(pos))
+    dangle_dx = np.radians(terrain.derivative(pos))
+    
+    # slope of the motor torque curve (flat outside the linear range)
+    linear = (omega >= 0) & (omega <= batch.omega_nl)
+    dtau_domega = np.where(linear, -(batch.tau_s-batch.tau_nl)/batch.omega_nl, 0.0)
+    
+    dFd_dv = 6*(Ng/r)*dtau_domega*(Ng/r)
+    
+    Crr = np.sqrt(0.0005/r) + 0.05
+    v_rover = r*omega/Ng
+    dFrr_dv = 80/np.sqrt(np.pi)*np.exp(-(40*v_rover)**2) * (-Crr*m*g*np.cos(angle))
+    dFrr_dangle = erf(40*v_rover) * (Crr*m*g*np.sin(angle))
+    dFg_dangle = -m*g*np.cos(angle)
+    
+    dF_dv = dFd_dv - dFrr_dv
+    dF_dx = (-dFrr_dangle - dFg_dangle)*dangle_dx
+    
+    on = active.astype(float)
+    J = bmat([[diags(on*dF_dv/m), diags(on*dF_dx/m)],
+              [diags(on), None]], format = 'csc')
+    
+    return J
+
+# Smallest batch simulate_rover_batch integrates as one system; smaller
+# ones are run one design at a time, which is cheaper for them (one design
+# through the batch path took 0.65 s against 0.42 s for simulate_rover)
+ROVER_BATCH_MIN = 4
+
+def simulate_rover_batch(rovers, planet, experiment, end_event, profile='stiff'):
+    """
+    Inputs:    rovers:  list              Rover dicts, one per design
+               planet:  dict              Data dictionary specifying planetary 
+                                          parameters
+           experiment:  dict              Data dictionary specifying experiment 
+                                          definition
+            end_event:  dict              Data dictionary containing the 
+                                          conditions necessary and sufficient 
+                                          to terminate simulation of rover 
+                                          dynamics
+              profile:  string or dict    (optional) Solver profile, as in
+                                          simulate_rover
+    
+    Outputs: telemetry:  list             Telemetry dict for each design, with
+                                          the same fields as simulate_rover
+                                          (solver_nfev is the count for the
+                                          whole batch)
+    
+    Integrates all designs as one 2N-state system. When a design hits one of
+    its end conditions the solve stops there, that design is frozen (masked
+    out of the dynamics and the events) and the rest carry on from the same
+    state. The rover dicts are not modified.
+    
+    All designs share the solver's steps, so each result agrees with its
+    own simulate_rover run to within solver tolerance rather than exactly.
+    Fewer than ROVER_BATCH_MIN designs are run through simulate_rover one at
+    a time instead, and then agree with it exactly.
+    """
+    
+    # Check that the rovers input is a list of dicts
+    if (type(rovers) != list) or (len(rovers) == 0):
+        raise Exception('rovers input must be a non-empty list of dicts')
+    for rover in rovers:
+        if type(rover) != dict:
+            raise Exception('rovers input must be a non-empty list of dicts')
+    
+    # Check that the planet input is a dict
+    if type(planet) != dict:
+        raise Exception('planet input must be a dict')
+    
+    # Check that the experiment input is a dict
+    if type(experiment) != dict:
+        raise Exception('experiment input must be a dict')
+        
+    # Check that the end_event input is a dict
+    if type(end_event) != dict:
+        raise Exception('end_event input must be a dict')
+    
+    # Look up the solver settings
+    if type(profile) == dict:
+        options = dict(profile)
+    elif profile in ROVER_SOLVER_PROFILES:
+        options = dict(ROVER_SOLVER_PROFILES[profile])
+    else:
+        raise Exception('profile must be one of {} or a dict of solve_ivp options'.format(list(ROVER_SOLVER_PROFILES)))
+    method = options.pop('method', 'BDF')
+    
+    # Main Code
+    N = len(rovers)
+    if N < ROVER_BATCH_MIN:
+        # the shallow copies keep simulate_rover from adding telemetry to
+        # the caller's dicts
+        telemetry = [simulate_rover(dict(rover), planet, experiment, end_event, profile)['telemetry']
+                     for rover in rovers]
+        nfev = sum(tel['solver_nfev'] for tel in telemetry)
+        for tel in telemetry:
+            tel['solver_nfev'] = nfev
+        return telemetry
+    
+    g = planet['g']
+    terrain = TerrainProfile(experiment['alpha_dist'], experiment['alpha_deg'])
+    params, batch = compile_rover_batch(rovers)
+    y0 = experiment['initial_conditions'].ravel()
+    
+    # same one-off F_net input checks as simulate_rover, for every design
+    alpha_deg = np.asarray(experiment['alpha_deg'], dtype = float).ravel()
+    for rover in rovers:
+        omega0 = motorW(y0[0:1], rover)
+        F_net(np.full(len(alpha_deg), omega0[0]), alpha_deg, rover, planet, experiment['Crr'])
+    
+    mission_distance = end_event['max_distance']
+    mission_min_velocity = end_event['min_velocity']
+    t_end = min(experiment['time_range'][1], end_event['max_time'])
+    
+    active = np.ones(N, dtype = bool)
+    fun = lambda t,y: rover_dynamics_batch(t, y, terrain, batch, g, active)
+    if method in ('BDF', 'Radau'):
+        options['jac'] = lambda t,y: rover_jacobian_batch(t, y, terrain, batch, g, active)
+    elif method == 'LSODA':
+        # LSODA only takes a dense (or banded) Jacobian
+        options['jac'] = lambda t,y: rover_jacobian_batch(t, y, terrain, batch, g, active).toarray()
+    
+    t = experiment['time_range'][0]
+    y = np.concatenate((np.full(N, y0[0]), np.full(N, y0[1])))
+    T = [np.array([t])]
+    Y = [y[:,None]]
+    t_stop = np.full(N, np.inf) # time at which each design was frozen
+    nfev = 0
+    
+    while np.any(active) and t < t_end:
+        
+        # distance and velocity events of the designs still driving
+        events = []
+        owners = []
+        for ii in np.flatnonzero(active):
+            distance_left = lambda t,y,ii=ii: mission_distance - y[N+ii]
+            distance_left.terminal = True
+            velocity_threshold = lambda t,y,ii=ii: y[ii] - mission_min_velocity
+            velocity_threshold.terminal = True
+            events += [distance_left, velocity_threshold]
+            owners += [ii, ii]
+        
+        sol = solve_ivp(fun, (t, t_end), y, method = method, events = events, **options)
+        nfev += sol.nfev
+        T.append(sol.t[1:])
+        Y.append(sol.y[:,1:])
+        t = sol.t[-1]
+        y = sol.y[:,-1]
+        
+        if sol.status != 1:
+            break
+        
+        # freeze every design whose end condition fired in the last step
+        for jj in range(len(events)):
+            if sol.t_events[jj].size > 0:
+                active[owners[jj]] = False
+                t_stop[owners[jj]] = t
+    
+    T = np.concatenate(T)
+    Y = np.concatenate(Y, axis = 1)
+    t_stop[active] = t
+    
+    telemetry = []
+    for ii in range(N):
+        
+        keep = T <= t_stop[ii]
+        time = T[keep]
+        velocity = Y[ii,keep]
+        position = Y[N+ii,keep]
+        
+        E = battenergy(time,velocity,rovers[ii],params[ii])
+        telemetry.append({'Time' : time,
+                          'completion_time' : time[-1],
+                          'velocity' : velocity,
+                          'position' : position,
+                          'distance_traveled' : position[-1],
+                          'max_velocity' : max(velocity),
+                          'average_velocity' : mean(velocity),
+                          'power' : mechpower(velocity, rovers[ii]),
+                          'battery_energy' : E,
+                          'energy_per_distance' : E/position[-1],
+                          'solver_nfev' : nfev})
+    
+    return telemetry
+
+def rover_mode_error(rover, planet, experiment, end_event, profile='stiff', mode='quasi_steady'):
+    """
+    Inputs:     rover:  dict              Data structure specifying rover 
+                                          parameters
+               planet:  dict              Data dictionary specifying planetary 
+                                          parameters
+           experiment:  dict              Data dictionary specifying experiment 
+                                          definition
+            end_event:  dict              Data dictionary containing the 
+                                          conditions to terminate the
+                                          simulation
+              profile:  string or dict    (optional) Solver profile, as in
+                                          simulate_rover
+                 mode:  string            (optional) Mode to check against
+                                          the full ODE
+    
+    Outputs:      err:  dict              Relative error of the mode's
+                                          telemetry against mode='ode' for
+                                          completion_time, distance_traveled,
+                                          max_velocity, battery_energy and
+                                          energy_per_distance, plus the RHS
+                                          calls of each run (nfev_mode,
+                                          nfev_ode)
+    
+    Runs simulate_rover both ways on copies of rover, so it costs a full ODE
+    solve. Use it to check that quasi_steady is good enough for a design
+    family before relying on it in a sweep.
+    """
+    
+    tel_mode = simulate_rover(dict(rover), planet, experiment, end_event, profile, mode)['telemetry']
+    tel_ode = simulate_rover(dict(rover), planet, experiment, end_event, profile, 'ode')['telemetry']
+    
+    err = {}
+    for key in ['completion_time', 'distance_traveled', 'max_velocity', 'battery_energy', 'energy_per_distance']:
+        err[key] = abs(tel_mode[key] - tel_ode[key])/abs(tel_ode[key])
+    err['nfev_mode'] = tel_mode['solver_nfev']
+    err['nfev_ode'] = tel_ode['solver_nfev']
+    
+    return err
+
+# State of the EDL system at the first crossing of an event, see
+# update_edl_state
+EDLEvent = namedtuple('EDLEvent', ['time', 'altitude', 'speed', 'rover_rel_pos', 'rover_rel_vel'])
+
+def _print_edl_event(message, event):
+    print("{:<30} {:<3} {:<8.4f} [s], {:<10} {:<9.4f} [m], {:<7} {:<9.4f} [m/s]".format(message, 't =', event.time, 'altitude =', event.altitude, 'speed =', event.speed))
+
+def _edl_switch_handler(subsystem, key, value, message):
+    
+    # handler for events that only move the EDL system to its next phase:
+    # sets edl_system[subsystem][key] to value (once) and restarts from the
+    # final state of the stage
+    
+    def handler(edl_system, Y, y0, event, ITER_INFO):
+        if edl_system[subsystem][key] != value:
+            edl_system[subsystem][key] = value
+            if ITER_INFO:
+                _print_edl_event(message, event)
+            y0 = Y[:, -1]
+        return y0, False
+    
+    return handler
+
+def _edl_sky_crane_on(edl_system, Y, y0, event, ITER_INFO):
+    # turn on sky crane if we're low enough (triggers event 4) and we're under a position-controlled regime
+    if not (edl_system["sky_crane"]["on"]) and edl_system["position_control"]["on"]:
+        edl_system["sky_crane"]["on"] = True
+        if ITER_INFO:
+            _print_edl_event('Turning on sky crane at', event)
+    y0 = Y[:, -1]
+    y0[5] = edl_system["sky_crane"]["velocity"]
+    return y0, False
+
+def _edl_out_of_fuel(edl_system, Y, y0, event, ITER_INFO):
+    # we are out of rocket fuel!
+    if edl_system["rocket"]["on"]:
+        edl_system["rocket"]["on"] = False
+        if ITER_INFO:
+            _print_edl_event('Ran out of rocket fuel at', event)
+        y0 = Y[:, -1]
+        y0[2] = 0.0
+        return y0, True
+    return y0, False
+
+def _edl_crashed(edl_system, Y, y0, event, ITER_INFO):
+    # edl crashed before sky crane is activated
+    if ITER_INFO:
+        _print_edl_event('EDL SYSTEM CRASHED INTO MARS AT', event)
+    return [], True
+
+def _edl_speed_control_on(edl_system, Y, y0, event, ITER_INFO):
+    # still descending, but slow enough to turn on speed controller
+    if not (edl_system["speed_control"]["on"]) and not (edl_system["position_control"]["on"]):
+        edl_system["speed_control"]["on"] = True
+        if ITER_INFO:
+            _print_edl_event('Turning on speed control at', event)
+    else:
+        edl_system['speed_control']['on'] = True
+        if ITER_INFO:
+            _print_edl_event('Trouble at', event)
+    y0 = Y[:, -1]
+    y0[3] = 0
+    y0[4] = 0
+    return y0, False
+
+def _edl_position_control_on(edl_system, Y, y0, event, ITER_INFO):
+    # now we're low enough to activate the altitude control (and turn off speed control)
+    if not (edl_system["position_control"]["on"]) and edl_system['speed_control']['on']:
+        edl_system["speed_control"]["on"] = False
+        edl_system["position_control"]["on"] = True
+        if ITER_INFO:
+            _print_edl_event('Turning on altitude control at', event)
+            y0 = Y[:, -1]
+            y0[3] = 0
+            y0[4] = 0
+    elif not (edl_system['position_control']['on']):
+        if ITER_INFO:
+            print("SYSTEM FAIL: SPEED CONTROL DID NOT ACTIVATE PRIOR TO ALTITUDE CONTROL")
+        return [], True
+    return y0, False
+
+def _edl_touchdown(edl_system, Y, y0, event, ITER_INFO):
+    # we've determined the rover position is at 0 altitude (on the ground)
+    rover_touchdown_speed = event.speed + event.rover_rel_vel
+    edl_system['rover_touchdown_speed'] = rover_touchdown_speed
+    
+    if event.altitude >= edl_system["sky_crane"]["danger_altitude"] and abs(
+        rover_touchdown_speed
+    ) <= abs(edl_system["sky_crane"]["danger_speed"]):
+        message = "The rover has landed!\n   t={:.4f} [s], rover pos = {:.4f} [m], rover speed = {:.4f} [m/s] (sky crane at h={:.4f}, v={:.6f})\n"
+    elif abs(rover_touchdown_speed) > abs(edl_system["sky_crane"]["danger_speed"]):
+        message = "EDL SYSTEM FAIL. Rover has landed, but possible damage due to touch down speed.\n >>> t={:.4f} [s], rover pos = {:10.4f} [m], rover speed = {:10.4f} [m/s] (sky crane at h={:10.4f}, v={:10.4f}\n"
+    else:
+        message = "EDL SYSTEM FAIL. Rover has landed, but possible damage due to sky crane low altitude.\n >>> t={:.4f} [s], rover pos = {:10.4f} [m], rover speed = {:10.4f} [m/s] (sky crane at h={:10.4f}, v={:10.4f}\n"
+    if ITER_INFO:
+        print(
+            message.format(
+                event.time,
+                event.altitude + event.rover_rel_pos,
+                event.speed + event.rover_rel_vel,
+                event.altitude,
+                event.speed,
+            )
+        )
+    edl_system["sky_crane"]["on"] = False
+    edl_system["rover"]["on_ground"] = True
+    return [], True
+
+# Events of the EDL simulation, in the order solve_ivp reports them. Each
+# entry gives the event function (built from the edl_system and
+# mission_events; the flag terms push an event out of reach once its phase
+# has started), the crossing direction, and the handler update_edl_state
+# runs when the event fires. A handler returns the initial conditions of the
+# next stage and whether the simulation ends. All events are terminal.
+EDL_EVENTS = [
+    {'name': 'heat_shield_eject',
+     'condition': lambda edl_system, mission_events: lambda t, y: y[1] - mission_events['alt_heatshield_eject'] - int(edl_system["heat_shield"]["ejected"])*999999,
+     'direction': -1,
+     'handler': _edl_switch_handler('heat_shield', 'ejected', True, 'Ejecting heat shield at')},
+    {'name': 'parachute_eject',
+     'condition': lambda edl_system, mission_events: lambda t, y: y[1] - mission_events['alt_parachute_eject'] - int(edl_system["parachute"]["ejected"])*999999,
+     'direction': -1,
+     'handler': _edl_switch_handler('parachute', 'ejected', True, 'Ejecting parachute at')},
+    {'name': 'rockets_on',
+     'condition': lambda edl_system, mission_events: lambda t, y: y[1] - mission_events['alt_rockets_on'] - int(edl_system["rocket"]["on"])*999999,
+     'direction': -1,
+     'handler': _edl_switch_handler('rocket', 'on', True, 'Turning on rockets at')},
+    {'name': 'sky_crane_on',
+     'condition': lambda edl_system, mission_events: lambda t, y: y[1] - mission_events['alt_skycrane_on'] - int(edl_system["sky_crane"]["on"])*999999,
+     'direction': -1,
+     'handler': _edl_sky_crane_on},
+    {'name': 'out_of_fuel',
+     'condition': lambda edl_system, mission_events: lambda t, y: y[2],
+     'direction': -1,
+     'handler': _edl_out_of_fuel},
+    {'name': 'crash',
+     'condition': lambda edl_system, mission_events: lambda t, y: y[1],
+     'direction': -1,
+     'handler': _edl_crashed},
+    {'name': 'speed_control_on',
+     'condition': lambda edl_system, mission_events: lambda t, y: y[0] - 3*edl_system['speed_control']['target_velocity'] + int(edl_system["speed_control"]["on"])*999999,
+     'direction': 1,
+     'handler': _edl_speed_control_on},
+    {'name': 'position_control_on',
+     'condition': lambda edl_system, mission_events: lambda t, y: y[1] - 1.2*mission_events['alt_skycrane_on'] - int(edl_system["position_control"]["on"])*999999,
+     'direction': -1,
+     'handler': _edl_position_control_on},
+    {'name': 'touchdown',
+     'condition': lambda edl_system, mission_events: lambda t, y: y[1] + y[6],
+     'direction': -1,
+     'handler': _edl_touchdown},
+]
+
 def edl_events(edl_system, mission_events):
 
     # Defines events that occur in EDL System simulation.
@@ -1066,50 +2437,133 @@ def edl_events(edl_system, mission_events):
     # 6. Reached speed at which speed-controlled descent is required
     # 7. Reached position at which altitude control is required
     # 8. Rover has touched down on surface of Mars
-
-    
-    event0 = lambda t, y: y[1] - mission_events['alt_heatshield_eject'] - int(edl_system["heat_shield"]["ejected"])*999999
-    event0.terminal = True
-    event0.direction = -1
+    #
+    # The events are generated from EDL_EVENTS.
     
-    event1 = lambda t, y: y[1] - mission_events['alt_parachute_eject'] - int(edl_system["parachute"]["ejected"])*999999
-    event1.terminal = True
-    event1.direction = -1
+    events = []
+    for entry in EDL_EVENTS:
+        event = entry['condition'](edl_system, mission_events)
+        event.terminal = True
+        event.direction = entry['direction']
+        events.append(event)
     
-    event2 = lambda t, y: y[1] - mission_events['alt_rockets_on'] - int(edl_system["rocket"]["on"])*999999
-    event2.terminal = True
-    event2.direction = -1
+    return events
 
-    event3 = lambda t, y: y[1] - mission_events['alt_skycrane_on'] - int(edl_system["sky_crane"]["on"])*999999
-    event3.terminal = True
-    event3.direction = -1
+# Phase flags of the EDL system, combined into the integer mode passed to
+# edl_dynamics_compiled (see edl_mode)
+EDL_ROCKET_ON = 1
+EDL_SPEED_CONTROL = 2
+EDL_POSITION_CONTROL = 4
+EDL_SKY_CRANE = 8
+
+# Constant quantities of an EDL system phase, see compile_edl
+EDLParams = namedtuple('EDLParams', ['num_rockets', 'm_jettison', 'm_rocket_structure',
+                                     'm_sky_crane', 'm_rover', 'g', 'buoyancy_g',
+                                     'volume', 'ACd', 'atmosphere', 'open_loop_thrust',
+                                     'min_thrust', 'max_thrust', 'v_exhaust',
+                                     'sc_Kp', 'sc_Kd', 'sc_Ki', 'sc_target_velocity',
+                                     'pc_Kp', 'pc_Kd', 'pc_Ki', 'pc_target_altitude',
+                                     'sky_crane_velocity', 'lowering_velocity', 'drag'])
+
+def edl_mode(edl_system):
+    
+    # Returns the phase of the EDL system (which of rockets, speed control,
+    # position control and sky crane are on) as EDL_* bit flags.
+    
+    mode = 0
+    if edl_system['rocket']['on']:
+        mode = mode | EDL_ROCKET_ON
+    if edl_system['speed_control']['on']:
+        mode = mode | EDL_SPEED_CONTROL
+    if edl_system['position_control']['on']:
+        mode = mode | EDL_POSITION_CONTROL
+    if edl_system['sky_crane']['on']:
+        mode = mode | EDL_SKY_CRANE
     
-    event4 = lambda t, y: y[2] 
-    event4.terminal = True
-    event4.direction = -1
+    return mode
+
+def compile_edl(edl_system, planet, drag_model=None):
     
-    event5 = lambda t, y: y[1]
-    event5.terminal = True
-    event5.direction = -1
+    # Pulls everything edl_dynamics_compiled needs out of edl_system and
+    # planet into an immutable EDLParams record. lowering_velocity is the
+    # rate the sky crane lowers the rover at in this phase (0 if it is off). Masses of jettisonable parts
+    # and the drag area depend on the phase (heat shield / parachute
+    # ejected), so compile again whenever update_edl_state changes it.
+    # Products are formed in the same order as in get_mass_edl,
+    # F_buoyancy_descent, F_drag_descent and edl_dynamics, so the compiled
+    # dynamics give identical results.
+    #
+    # drag_model (see get_drag_model) is compiled to drag: None for the
+    # constant-Cd F_drag_descent, which the RHS evaluates inline from ACd;
+    # otherwise drag(altitude, velocity, density) calls the model on a copy
+    # of edl_system taken here.
     
-    event6 = lambda t, y: y[0] - 3*edl_system['speed_control']['target_velocity'] + int(edl_system["speed_control"]["on"])*999999
-    event6.terminal = True
-    event6.direction = 1
+    rocket = edl_system['rocket']
+    num_rockets = edl_system['num_rockets']
     
-    event7 = lambda t, y: y[1] - 1.2*mission_events['alt_skycrane_on'] - int(edl_system["position_control"]["on"])*999999
-    event7.terminal = True
-    event7.direction = -1
+    # parachute and heat shield mass, if still attached (as in get_mass_edl)
+    m_jettison = int(not(edl_system['parachute']['ejected']))*edl_system['parachute']['mass'] + \
+        int(not(edl_system['heat_shield']['ejected']))*edl_system['heat_shield']['mass']
     
-    event8 = lambda t, y: y[1] + y[6]
-    event8.terminal = True
-    event8.direction = -1
-
+    # drag area times drag coefficient (as in F_drag_descent)
+    if not edl_system['heat_shield']['ejected']:
+        ACd_body = np.pi*(edl_system['heat_shield']['diameter']/2.0)**2*edl_system['heat_shield']['Cd']
+    else:
+        ACd_body = edl_system['sky_crane']['area']*edl_system['sky_crane']['Cd']
+    if edl_system['parachute']['deployed'] and not edl_system['parachute']['ejected']:
+        ACd_parachute = np.pi*(edl_system['parachute']['diameter']/2.0)**2*edl_system['parachute']['Cd']
+    else:
+        ACd_parachute = 0.0
     
-    events = [event0, event1, event2, event3, event4, event5, event6, event7, event8]
+    if 'atmosphere' in planet:
+        atmosphere = planet['atmosphere']
+    else:
+        atmosphere = partial(get_local_atm_properties, planet)
     
-    return events
-
-def edl_dynamics(t, y, edl_system, planet):
+    drag_model = get_drag_model(drag_model, edl_system)
+    if drag_model is F_drag_descent:
+        drag = None
+    else:
+        drag = partial(drag_model, deepcopy(edl_system), planet)
+    
+    params = EDLParams(num_rockets = num_rockets,
+                       m_jettison = m_jettison,
+                       m_rocket_structure = rocket['structure_mass'],
+                       m_sky_crane = edl_system['sky_crane']['mass'],
+                       m_rover = get_mass_rover(edl_system['rover']),
+                       g = planet['g'],
+                       buoyancy_g = np.sign(planet['g'])*planet['g'],
+                       volume = edl_system['volume'],
+                       ACd = ACd_body+ACd_parachute,
+                       atmosphere = atmosphere,
+                       open_loop_thrust = 0.9*rocket['max_thrust']*num_rockets,
+                       min_thrust = num_rockets*rocket['min_thrust'],
+                       max_thrust = num_rockets*rocket['max_thrust'],
+                       v_exhaust = rocket['effective_exhaust_velocity'],
+                       sc_Kp = edl_system['speed_control']['Kp'],
+                       sc_Kd = edl_system['speed_control']['Kd'],
+                       sc_Ki = edl_system['speed_control']['Ki'],
+                       sc_target_velocity = edl_system['speed_control']['target_velocity'],
+                       pc_Kp = edl_system['position_control']['Kp'],
+                       pc_Kd = edl_system['position_control']['Kd'],
+                       pc_Ki = edl_system['position_control']['Ki'],
+                       pc_target_altitude = edl_system['position_control']['target_altitude'],
+                       sky_crane_velocity = edl_system['sky_crane']['velocity'],
+                       lowering_velocity = edl_system['sky_crane']['velocity'] if edl_system['sky_crane']['on'] else 0,
+                       drag = drag)
+    
+    return params
+
+def edl_dynamics(t, y, edl_system, planet, drag_model=None):
+    
+    # Dynamics of EDL as it descends and lowers the rover to the surface, for
+    # the current phase of edl_system and the drag model drag_model (see
+    # get_drag_model). Compiles the system on every call; simulate_edl
+    # compiles once per phase and calls the phase RHS directly.
+    
+    return edl_dynamics_compiled(t, y, compile_edl(edl_system, planet, drag_model), edl_mode(edl_system))
+
+def edl_dynamics_compiled(t, y, params, mode):
 
     # Dynamics of EDL as it descends and lowers the rover to the surface. 
     # State vector: 
@@ -1135,7 +2589,11 @@ def edl_dynamics(t, y, edl_system, planet):
     # v_rel*(dm/dt) is a force, we can write this as F_ext + F_thrust = ma,
     # which is very Newton-like.
     #
-    #
+    # params is the compile_edl record of the EDL system and mode the
+    # edl_mode bit flags for the current phase. Nothing is looked up in or
+    # written to the edl_system dict, so this is a pure function of its
+    # inputs. Arithmetic is done in the same order as the dict-based force
+    # functions, so results are identical to them.
     #
 
 
@@ -1151,21 +2609,21 @@ def edl_dynamics(t, y, edl_system, planet):
     pos_rov = y[6]       # [m] position of rover relative to sky crane
     
     # ***
-    # Record the current mass of the system. Since the edl_system being passed
-    # is the initial state system, need to update the fuel mass as we go. This
-    # is an artefact of how ode45 and its cousins are implemented.
-    edl_system['rocket']['fuel_mass'] = fuel_mass/edl_system['num_rockets'] 
-    edl_mass = get_mass_edl(edl_system)
-    
-    
-    # Forces EXCEPT THRUST acting on EDL System
-    F_ext = F_gravity_descent(edl_system,planet) + F_buoyancy_descent(edl_system,planet,altitude_edl)+ F_drag_descent(edl_system,planet,altitude_edl,vel_edl)
-
-    # Remove comment if you want some extra debugging display
-    #print('\n')  
-    #print(F_gravity_descent(edl_system,planet))
-    #print(F_buoyancy_descent(edl_system,planet,altitude_edl))
-    #print(F_drag_descent(edl_system,planet,altitude_edl,vel_edl))
+    # Current mass of the system (same sum as get_mass_edl, with the fuel
+    # mass taken from the state vector)
+    p = params
+    edl_mass = p.m_jettison + p.num_rockets*(p.m_rocket_structure + fuel_mass/p.num_rockets) + p.m_sky_crane + p.m_rover
+    
+    
+    # Forces EXCEPT THRUST acting on EDL System (one atmosphere lookup for
+    # all): gravity, buoyancy and drag as in F_gravity_descent,
+    # F_buoyancy_descent and F_drag_descent
+    density, _, _ = p.atmosphere(altitude_edl)
+    if p.drag is None:
+        F_drag = 0.5*density*vel_edl**2*p.ACd
+    else:
+        F_drag = p.drag(altitude_edl, vel_edl, density)
+    F_ext = edl_mass*p.g + p.buoyancy_g*density*p.volume + F_drag
 
 
 
@@ -1180,10 +2638,10 @@ def edl_dynamics(t, y, edl_system, planet):
     
     # ****************
     # EDL System Dynamics
-    if edl_system['rocket']['on'] and not(edl_system['speed_control']['on']) and not(edl_system['position_control']['on']):
+    if (mode & EDL_ROCKET_ON) and not(mode & EDL_SPEED_CONTROL) and not(mode & EDL_POSITION_CONTROL):
     
         # ** Uncontrolled (0.95*max) rocket firing
-        F_thrust = 0.9*edl_system['rocket']['max_thrust']*edl_system['num_rockets']  # Thrust from rockets
+        F_thrust = p.open_loop_thrust  # Thrust from rockets
 
         dy1dt = (F_ext+F_thrust)/edl_mass   # acceleration
         dy2dt = vel_edl                     # velocity
@@ -1191,22 +2649,22 @@ def edl_dynamics(t, y, edl_system, planet):
         # Change in total mass of rockets due to propellant being expelled to
         # produce thrust. Calculate this as F_thrust/v_rel, where v_rel is the
         # effective exhaust velocity of the propellant
-        dmdt = -(F_thrust/edl_system['rocket']['effective_exhaust_velocity'])
+        dmdt = -(F_thrust/p.v_exhaust)
         
         # error signals
         e_vel = 0
         e_pos = 0
 
     
-    elif edl_system['rocket']['on'] and edl_system['speed_control']['on']:
+    elif (mode & EDL_ROCKET_ON) and (mode & EDL_SPEED_CONTROL):
     
         # ** This is the dynamical regime for when the rockets are firing 
         # ** with a speed controller    
         
         # PID gains
-        Kp = edl_system['speed_control']['Kp']
-        Kd = edl_system['speed_control']['Kd']
-        Ki = edl_system['speed_control']['Ki']
+        Kp = p.sc_Kp
+        Kd = p.sc_Kd
+        Ki = p.sc_Ki
 
     
         # error and error integral -- can't compute error derivative explicitly
@@ -1214,20 +2672,20 @@ def edl_dynamics(t, y, edl_system, planet):
         # dy1dt (acceleration). However, we need dedt to compute F_thrust and
         # F_thrust to compute dy1dt. So the solution is to rearrange thing
         # symbolically so that we eliminate the error derivative term.
-        e_vel = edl_system['speed_control']['target_velocity']-vel_edl
+        e_vel = p.sc_target_velocity-vel_edl
     
     
-        num = (Kp*e_vel + Kd*(F_ext/edl_mass) + Ki*ei_vel) - edl_mass*planet['g']
+        num = (Kp*e_vel + Kd*(F_ext/edl_mass) + Ki*ei_vel) - edl_mass*p.g
         den = (1-Kd/edl_mass)
         F_thrust = num/den
     
         # this ensures we never try to reverse thrust (which is impossible in
         # this system)
-        F_thrust = max(edl_system['num_rockets']*edl_system['rocket']['min_thrust'], F_thrust)
+        F_thrust = max(p.min_thrust, F_thrust)
     
         # this checks for saturation of thrust (more than 100# of what rockets
         # can deliver)
-        F_thrust = min(F_thrust, edl_system['num_rockets']*edl_system['rocket']['max_thrust'])
+        F_thrust = min(F_thrust, p.max_thrust)
         
       
         # acceleration and velocity, respectively 
@@ -1238,34 +2696,34 @@ def edl_dynamics(t, y, edl_system, planet):
         # Change in total mass of rockets due to propellant being expelled to
         # produce thrust. Calculate this as F_thrust/v_rel, where v_rel is the
         # effective exhaust velocity of the propellant
-        dmdt = -(F_thrust/edl_system['rocket']['effective_exhaust_velocity'])
+        dmdt = -(F_thrust/p.v_exhaust)
     
         # position error
         e_pos = 0
     
-    elif edl_system['rocket']['on'] and edl_system['position_control']['on']:
+    elif (mode & EDL_ROCKET_ON) and (mode & EDL_POSITION_CONTROL):
     
         # ** This is the dynamical regime for when the rockets are firing 
         # ** with an altitude controller    
         
-        Kp = edl_system['position_control']['Kp']
-        Kd = edl_system['position_control']['Kd']
-        Ki = edl_system['position_control']['Ki']
+        Kp = p.pc_Kp
+        Kd = p.pc_Kd
+        Ki = p.pc_Ki
 
     
         # position error and change in that error. note sign convention. 
-        e_pos = edl_system['position_control']['target_altitude'] - altitude_edl
+        e_pos = p.pc_target_altitude - altitude_edl
         dedt_pos = -vel_edl
         
-        # note: planet['g'] is <0 due to sign convention, so negating here gives a
+        # note: g is <0 due to sign convention, so negating here gives a
         # positive valued thrust. 
-        F_thrust = edl_system['num_rockets']*(Kp*e_pos + Kd*dedt_pos + Ki*ei_pos) - planet['g']*edl_mass
+        F_thrust = p.num_rockets*(Kp*e_pos + Kd*dedt_pos + Ki*ei_pos) - p.g*edl_mass
         
         # enforces a minimum thrust level since we cannot thrust downward
-        F_thrust = max(edl_system['rocket']['min_thrust']*edl_system['num_rockets'], F_thrust)
+        F_thrust = max(p.min_thrust, F_thrust)
            
         # enforces a maximum thrust level (saturation condition)
-        F_thrust = min(F_thrust, edl_system['num_rockets']*edl_system['rocket']['max_thrust'])
+        F_thrust = min(F_thrust, p.max_thrust)
         
         # velocity and acceleration 
         dy2dt = vel_edl     
@@ -1274,7 +2732,7 @@ def edl_dynamics(t, y, edl_system, planet):
         # Change in total mass of rockets due to propellant being expelled to
         # produce thrust. Calculate this as F_thrust/v_rel, where v_rel is the
         # effective exhaust velocity of the propellant
-        dmdt = -(F_thrust/edl_system['rocket']['effective_exhaust_velocity'])
+        dmdt = -(F_thrust/p.v_exhaust)
     
          # velocity error 
         e_vel = 0
@@ -1296,14 +2754,14 @@ def edl_dynamics(t, y, edl_system, planet):
         e_pos = 0
         
     # Sky Crane dynamics (lowering the rover)
-    if edl_system['sky_crane']['on']:
+    if mode & EDL_SKY_CRANE:
         
         # this is a 1st order model. We instantaneously jump to constant
         # velocity and then stay there (the jump is handled by an initial
         # condition).
         
         dy6dt = 0 # model as constant velocity (zero accel) process
-        dy7dt = edl_system['sky_crane']['velocity']
+        dy7dt = p.sky_crane_velocity
         
     #     print('sky crane platform: h = #f\tv = #f\ta = #f\n',altitude_edl,vel_edl,dy1dt)
     #     print('rover status (rel): h = #f\tv = #f\ta = #f\n',pos_rov,vel_rov,dy6dt)
@@ -1320,6 +2778,122 @@ def edl_dynamics(t, y, edl_system, planet):
     
     return dydt
 
+# ****************
+# Phase-specific versions of edl_dynamics_compiled. simulate_edl restarts the
+# solver at every phase change anyway, so it picks one of these with
+# edl_phase_dynamics and the RHS carries only the terms active in that
+# phase. Each one does the arithmetic of the matching branch of
+# edl_dynamics_compiled in the same order, so trajectories are identical.
+
+def edl_dynamics_ballistic(t, y, p):
+    
+    # Rockets off (or out of fuel): gravity, buoyancy and drag only
+    
+    vel_edl = y[0]
+    edl_mass = p.m_jettison + p.num_rockets*(p.m_rocket_structure + y[2]/p.num_rockets) + p.m_sky_crane + p.m_rover
+    density, _, _ = p.atmosphere(y[1])
+    if p.drag is None:
+        F_drag = 0.5*density*vel_edl**2*p.ACd
+    else:
+        F_drag = p.drag(y[1], vel_edl, density)
+    F_ext = edl_mass*p.g + p.buoyancy_g*density*p.volume + F_drag
+    
+    return np.array([F_ext/edl_mass, vel_edl, 0, 0, 0, 0, p.lowering_velocity])
+
+def edl_dynamics_full_thrust(t, y, p):
+    
+    # Rockets firing open loop at 90% of max thrust
+    
+    vel_edl = y[0]
+    edl_mass = p.m_jettison + p.num_rockets*(p.m_rocket_structure + y[2]/p.num_rockets) + p.m_sky_crane + p.m_rover
+    density, _, _ = p.atmosphere(y[1])
+    if p.drag is None:
+        F_drag = 0.5*density*vel_edl**2*p.ACd
+    else:
+        F_drag = p.drag(y[1], vel_edl, density)
+    F_ext = edl_mass*p.g + p.buoyancy_g*density*p.volume + F_drag
+    F_thrust = p.open_loop_thrust
+    
+    return np.array([(F_ext+F_thrust)/edl_mass, vel_edl, -(F_thrust/p.v_exhaust), 0, 0, 0, p.lowering_velocity])
+
+def edl_dynamics_speed_control(t, y, p):
+    
+    # Rockets firing under the speed PID controller
+    
+    vel_edl = y[0]
+    edl_mass = p.m_jettison + p.num_rockets*(p.m_rocket_structure + y[2]/p.num_rockets) + p.m_sky_crane + p.m_rover
+    density, _, _ = p.atmosphere(y[1])
+    if p.drag is None:
+        F_drag = 0.5*density*vel_edl**2*p.ACd
+    else:
+        F_drag = p.drag(y[1], vel_edl, density)
+    F_ext = edl_mass*p.g + p.buoyancy_g*density*p.volume + F_drag
+    
+    Kd = p.sc_Kd
+    e_vel = p.sc_target_velocity-vel_edl
+    num = (p.sc_Kp*e_vel + Kd*(F_ext/edl_mass) + p.sc_Ki*y[3]) - edl_mass*p.g
+    den = (1-Kd/edl_mass)
+    F_thrust = min(max(p.min_thrust, num/den), p.max_thrust)
+    
+    return np.array([(F_ext + F_thrust)/edl_mass, vel_edl, -(F_thrust/p.v_exhaust), e_vel, 0, 0, p.lowering_velocity])
+
+def edl_dynamics_position_control(t, y, p):
+    
+    # Rockets firing under the altitude PID controller (the sky crane phase)
+    
+    vel_edl = y[0]
+    altitude_edl = y[1]
+    edl_mass = p.m_jettison + p.num_rockets*(p.m_rocket_structure + y[2]/p.num_rockets) + p.m_sky_crane + p.m_rover
+    density, _, _ = p.atmosphere(altitude_edl)
+    if p.drag is None:
+        F_drag = 0.5*density*vel_edl**2*p.ACd
+    else:
+        F_drag = p.drag(altitude_edl, vel_edl, density)
+    F_ext = edl_mass*p.g + p.buoyancy_g*density*p.volume + F_drag
+    
+    e_pos = p.pc_target_altitude - altitude_edl
+    F_thrust = p.num_rockets*(p.pc_Kp*e_pos + p.pc_Kd*(-vel_edl) + p.pc_Ki*y[4]) - p.g*edl_mass
+    F_thrust = min(max(p.min_thrust, F_thrust), p.max_thrust)
+    
+    return np.array([(F_ext+F_thrust)/edl_mass, vel_edl, -(F_thrust/p.v_exhaust), 0, e_pos, 0, p.lowering_velocity])
+
+def edl_phase_dynamics(mode):
+    
+    # Returns the phase-specific RHS for an edl_mode value, following the
+    # same precedence as the if/elif chain of edl_dynamics_compiled.
+    
+    if (mode & EDL_ROCKET_ON) and not(mode & EDL_SPEED_CONTROL) and not(mode & EDL_POSITION_CONTROL):
+        return edl_dynamics_full_thrust
+    elif (mode & EDL_ROCKET_ON) and (mode & EDL_SPEED_CONTROL):
+        return edl_dynamics_speed_control
+    elif (mode & EDL_ROCKET_ON) and (mode & EDL_POSITION_CONTROL):
+        return edl_dynamics_position_control
+    else:
+        return edl_dynamics_ballistic
+
+def edl_phase(mode):
+    
+    # Returns the name of the phase an edl_mode value runs in (the same
+    # precedence as edl_phase_dynamics): 'descent', 'full_thrust',
+    # 'speed_control' or 'position_control'.
+    
+    if (mode & EDL_ROCKET_ON) and not(mode & EDL_SPEED_CONTROL) and not(mode & EDL_POSITION_CONTROL):
+        return 'full_thrust'
+    elif (mode & EDL_ROCKET_ON) and (mode & EDL_SPEED_CONTROL):
+        return 'speed_control'
+    elif (mode & EDL_ROCKET_ON) and (mode & EDL_POSITION_CONTROL):
+        return 'position_control'
+    else:
+        return 'descent'
+
+def edl_max_step(mode, mission_events):
+    
+    # Largest solver step for the phase of an edl_mode value, from
+    # mission_events['max_step']. Phases that are not listed there (and
+    # mission_events without a 'max_step' entry) use 0.1 s.
+    
+    return mission_events.get('max_step', {}).get(edl_phase(mode), 0.1)
+
 def update_edl_state(edl_system, TE, YE, Y, ITER_INFO):
     # update_edl
     #
@@ -1336,6 +2910,8 @@ def update_edl_state(edl_system, TE, YE, Y, ITER_INFO):
     # 8. Rover has touched down on surface of Mars
     #
     # This also updates the rocket mass (due to fuel having been expelled).
+    # Only the handlers (see EDL_EVENTS) of the events that fired are run, in
+    # event order.
 
     # default initial conditions are final conditions of prior time interval.
     y0 = Y[:, -1]
@@ -1345,222 +2921,46 @@ def update_edl_state(edl_system, TE, YE, Y, ITER_INFO):
     edl_system["velocity"] = y0[0]
 
     TERMINATE_SIM = False
-    # num_events = length(IE);
-    # num_events = len(TE)
-
-    for i in range(9):  
-
-        event = i
-
-        if event == 0:  # heat shield eject
-            if TE[i].size != 0:
-                time = TE[i][0]
-                altitude = YE[i][0, 1]
-                speed = YE[i][0, 0]
-                rover_rel_pos = YE[i][0, 6]
-                rover_rel_vel = YE[i][0, 5]
-                if not (edl_system["heat_shield"]["ejected"]):
-                    edl_system["heat_shield"]["ejected"] = True
-                    if ITER_INFO:
-                        print("{:<30} {:<3} {:<8.4f} [s], {:<10} {:<9.4f} [m], {:<7} {:<9.4f} [m/s]".format('Ejecting heat shield at', 't =', time, 'altitude =', altitude, 'speed =', speed))
-                    y0 = Y[:, -1]
-                    #y0[1] = y0[1]  # - 0.001
-
-        if event == 1:  # parachute shield eject
-            if TE[i].size != 0:
-                time = TE[i][0]
-                altitude = YE[i][0, 1]
-                speed = YE[i][0, 0]
-                rover_rel_pos = YE[i][0, 6]
-                rover_rel_vel = YE[i][0, 5]
-                if not (edl_system["parachute"]["ejected"]):
-                    edl_system["parachute"]["ejected"] = True
-                    if ITER_INFO:
-                        print("{:<30} {:<3} {:<8.4f} [s], {:<10} {:<9.4f} [m], {:<7} {:<9.4f} [m/s]".format('Ejecting parachute at', 't =', time, 'altitude =', altitude, 'speed =', speed))
-                    y0 = Y[:, -1]
-                    #y0[1] = y0[1] #- 0.001
-
-        if event == 2:  # turning on rockets, but w/o control
-            if TE[i].size != 0:
-                time = TE[i][0]
-                altitude = YE[i][0, 1]
-                speed = YE[i][0, 0]
-                rover_rel_pos = YE[i][0, 6]
-                rover_rel_vel = YE[i][0, 5]
-                if not (edl_system["rocket"]["on"]):
-                    edl_system["rocket"]["on"] = True
-                    # edl_system['rocket_control']['on'] = False
-                    if ITER_INFO:
-                        print("{:<30} {:<3} {:<8.4f} [s], {:<10} {:<9.4f} [m], {:<7} {:<9.4f} [m/s]".format('Turning on rockets at', 't =', time, 'altitude =', altitude, 'speed =', speed))
-                    y0 = Y[:, -1]
-                    #y0[1] = y0[1] # - 0.001
-
-        if event == 3:  # turn on sky crane if we're low enough (triggers event 4) and we're under a position-controlled regime
-            if TE[i].size != 0:
-                time = TE[i][0]
-                altitude = YE[i][0, 1]
-                speed = YE[i][0, 0]
-                rover_rel_pos = YE[i][0, 6]
-                rover_rel_vel = YE[i][0, 5]
-                if not (edl_system["sky_crane"]["on"]) and edl_system["position_control"]["on"]:
-                    edl_system["sky_crane"]["on"] = True
-                    if ITER_INFO:
-                        print("{:<30} {:<3} {:<8.4f} [s], {:<10} {:<9.4f} [m], {:<7} {:<9.4f} [m/s]".format('Turning on sky crane at', 't =', time, 'altitude =', altitude, 'speed =', speed))
-                y0 = Y[:, -1]
-                y0[5] = edl_system["sky_crane"]["velocity"]
-                #y0[1] = y0[1]  - 0.0001
-
-
-
-        if event == 4:  # we are out of rocket fuel!
-            if TE[i].size != 0:
-                time = TE[i][0]
-                altitude = YE[i][0, 1]
-                speed = YE[i][0, 0]
-                rover_rel_pos = YE[i][0, 6]
-                rover_rel_vel = YE[i][0, 5]
-                if edl_system["rocket"]["on"]:
-                    edl_system["rocket"]["on"] = False
-                    if ITER_INFO:
-                        print("{:<30} {:<3} {:<8.4f} [s], {:<10} {:<9.4f} [m], {:<7} {:<9.4f} [m/s]".format('Ran out of rocket fuel at', 't =', time, 'altitude =', altitude, 'speed =', speed))
-                    #y0 = Y[:, -1]
-                    #y0[2] = 0 - .01  # no more fuel
-                    y0 = Y[:, -1]
-                    y0[2] = 0.0 
-                    TERMINATE_SIM = True
-                    
-
-        if event == 5:  # edl crashed before sky crane is activated
-            if TE[i].size != 0:
-                time = TE[i][0]
-                altitude = YE[i][0, 1]
-                speed = YE[i][0, 0]
-                rover_rel_pos = YE[i][0, 6]
-                rover_rel_vel = YE[i][0, 5]
-                if ITER_INFO:
-                    print("{:<30} {:<3} {:<8.4f} [s], {:<10} {:<9.4f} [m], {:<7} {:<9.4f} [m/s]".format('EDL SYSTEM CRASHED INTO MARS AT', 't =', time, 'altitude =', altitude, 'speed =', speed))
-                y0 = []
-                TERMINATE_SIM = True
-
-
-
-        if event == 6:  # still descending, but slow enough to turn on speed controller
-            if TE[i].size != 0:
-                time = TE[i][0]
-                altitude = YE[i][0, 1]
-                speed = YE[i][0, 0]
-                rover_rel_pos = YE[i][0, 6]
-                rover_rel_vel = YE[i][0, 5]
-                if not (edl_system["speed_control"]["on"]) and not (edl_system["position_control"]["on"]):
-                    edl_system["speed_control"]["on"] = True
-                    if ITER_INFO:
-                        print("{:<30} {:<3} {:<8.4f} [s], {:<10} {:<9.4f} [m], {:<7} {:<9.4f} [m/s]".format('Turning on speed control at', 't =', time, 'altitude =', altitude, 'speed =', speed))
-                else:
-                    edl_system['speed_control']['on'] = True
-                    if ITER_INFO:
-                        print("{:<30} {:<3} {:<8.4f} [s], {:<10} {:<9.4f} [m], {:<7} {:<9.4f} [m/s]".format('Trouble at', 't =', time, 'altitude =', altitude, 'speed =', speed))
-                y0 = Y[:, -1]
-                y0[3] = 0
-                y0[4] = 0
-                #y0[0] = y0[0] #+ 0.01
-
-
-        if event == 7:  # now we're low enough to activate the altitude control (and turn off speed control)
-            if TE[i].size != 0:
-                time = TE[i][0]
-                altitude = YE[i][0, 1]
-                speed = YE[i][0, 0]
-                rover_rel_pos = YE[i][0, 6]
-                rover_rel_vel = YE[i][0, 5]
-                if not (edl_system["position_control"]["on"]) and edl_system['speed_control']['on']:
-                    edl_system["speed_control"]["on"] = False
-                    edl_system["position_control"]["on"] = True
-                    if ITER_INFO:
-                        print("{:<30} {:<3} {:<8.4f} [s], {:<10} {:<9.4f} [m], {:<7} {:<9.4f} [m/s]".format('Turning on altitude control at', 't =', time, 'altitude =', altitude, 'speed =', speed))
-                        y0 = Y[:, -1]
-                        y0[3] = 0
-                        y0[4] = 0
-                        #y0[1] = y0[1] # - 0.00001
-                elif not (edl_system['position_control']['on']):
-                    if ITER_INFO:
-                        print("SYSTEM FAIL: SPEED CONTROL DID NOT ACTIVATE PRIOR TO ALTITUDE CONTROL")
-                    TERMINATE_SIM = True
-                    y0 = []
-                    #edl_system = redefine_edl_system(edl_system)
-
-
-        if event == 8:  # we've determined the rover position is at 0 altitude (on the ground)
-            if TE[i].size != 0:
-                time = TE[i][0]
-                altitude = YE[i][0, 1]
-                speed = YE[i][0, 0]
-                rover_rel_pos = YE[i][0, 6]
-                rover_rel_vel = YE[i][0, 5]
-                rover_touchdown_speed = speed + rover_rel_vel
-                edl_system['rover_touchdown_speed'] = rover_touchdown_speed
-
-                if altitude >= edl_system["sky_crane"]["danger_altitude"] and abs(
-                    rover_touchdown_speed
-                ) <= abs(edl_system["sky_crane"]["danger_speed"]):
-                    if ITER_INFO:
-                        print(
-                            "The rover has landed!\n   t={:.4f} [s], rover pos = {:.4f} [m], rover speed = {:.4f} [m/s] (sky crane at h={:.4f}, v={:.6f})\n".format(
-                                time,
-                                altitude + rover_rel_pos,
-                                speed + rover_rel_vel,
-                                altitude,
-                                speed,
-                            )
-                        )
-                    y0 = []
-                    TERMINATE_SIM = True
-                    edl_system["sky_crane"]["on"] = False
-                    edl_system["rover"]["on_ground"] = True
-
-                elif abs(rover_touchdown_speed) > abs(
-                    edl_system["sky_crane"]["danger_speed"]
-                ):
-                    if ITER_INFO:
-                        print(
-                            "EDL SYSTEM FAIL. Rover has landed, but possible damage due to touch down speed.\n >>> t={:.4f} [s], rover pos = {:10.4f} [m], rover speed = {:10.4f} [m/s] (sky crane at h={:10.4f}, v={:10.4f}\n".format(
-                                time,
-                                altitude + rover_rel_pos,
-                                speed + rover_rel_vel,
-                                altitude,
-                                speed,
-                            )
-                        )
-                    y0 = []
-                    TERMINATE_SIM = True
-                    edl_system['sky_crane']['on'] = False
-                    edl_system["rover"]["on_ground"] = True
-                   
-
-                elif altitude < edl_system["sky_crane"]["danger_altitude"]:
-                    if ITER_INFO:
-                        print(
-                            "EDL SYSTEM FAIL. Rover has landed, but possible damage due to sky crane low altitude.\n >>> t={:.4f} [s], rover pos = {:10.4f} [m], rover speed = {:10.4f} [m/s] (sky crane at h={:10.4f}, v={:10.4f}\n".format(
-                                time,
-                                altitude + rover_rel_pos,
-                                speed + rover_rel_vel,
-                                altitude,
-                                speed,
-                            )
-                        )
-                    y0 = []
-                    TERMINATE_SIM = True
-                    edl_system["sky_crane"]["on"] = False
-                    edl_system["rover"]["on_ground"] = True
 
+    for i, te in enumerate(TE):
+        if te.size == 0:
+            continue
+        ye = YE[i][0]
+        event = EDLEvent(te[0], ye[1], ye[0], ye[6], ye[5])
+        y0, terminate = EDL_EVENTS[i]['handler'](edl_system, Y, y0, event, ITER_INFO)
+        TERMINATE_SIM = TERMINATE_SIM or terminate
 
     return edl_system, y0, TERMINATE_SIM
 
-def simulate_edl(edl_system, planet, mission_events, tmax, ITER_INFO):
+def simulate_edl(edl_system, planet, mission_events, tmax, ITER_INFO, record='full', stats=None, drag_model=None):
     # simulate_edl
     #
     # This simulates the EDL system. It requires a definition of the
     # edl_system, the planet, the mission events, a maximum simulation time and
     # has an optional flag to display detailed iteration information.
+    #
+    # record sets how much of the trajectory is returned in T and Y:
+    #   'full'   - every solver step (default)
+    #   'events' - the initial state and the state at the end of each stage,
+    #              i.e. at every event that changed the phase
+    #   'none'   - only the final state
+    # In all cases T[-1] and Y[:, -1] are the same final time and state, so
+    # callers that only need those (the objective and constraints of the
+    # optimizer) should use 'none': the solver then stores no steps and no
+    # trajectory is concatenated.
+    #
+    # If a dict is passed as stats, the number of RHS evaluations of the run
+    # is stored in stats['nfev'] (for comparing solver settings).
+    #
+    # drag_model picks the drag model for this run (see get_drag_model):
+    # 'constant_cd' (the default), 'mach', or any callable with the
+    # F_drag_descent signature. It is a per-call argument, so runs with
+    # different drag models can go side by side in threads or processes.
+    
+    if record not in ('full', 'events', 'none'):
+        raise Exception("record must be 'full', 'events' or 'none'")
+    
+    drag_model = get_drag_model(drag_model, edl_system)
     
     # handle to events function for edl simulation
     #h_edl_events = lambda t, y: edl_events(t, y, edl_system, mission_events)
@@ -1584,17 +2984,48 @@ def simulate_edl(edl_system, planet, mission_events, tmax, ITER_INFO):
         print('Commencing simulation run...\n')
     
     
-    # declare our variables (just empty arrays)
-    T = np.array([])
-    Y = np.array([[], [], [], [], [], [], []])
+    # trajectory pieces, one per stage; joined once at the end so each stage
+    # does not copy the whole history again
+    T_parts = []
+    Y_parts = []
+    if record == 'events':
+        T_parts.append(np.array([tspan[0]], dtype=float))
+        Y_parts.append(np.array(y0, dtype=float).reshape(-1, 1))
+    nfev = 0
     TERMINATE_SIM = False
     while not(TERMINATE_SIM):
         
         # run simulation until an event occurs 
-        fun = lambda t, y: edl_dynamics(t, y, edl_system, planet)
-        sol = solve_ivp(fun, tspan, y0, method='DOP853', events=events, max_step=0.1)
-        t_part = sol.t
-        Y_part = sol.y
+        # the phase only changes between stages, so compile it and pick its
+        # RHS once per stage
+        params = compile_edl(edl_system, planet, drag_model)
+        mode = edl_mode(edl_system)
+        rhs = edl_phase_dynamics(mode)
+        fun = lambda t, y: rhs(t, y, params)
+        if record == 'full':
+            sol = solve_ivp(fun, tspan, y0, method='DOP853', events=events,
+                            max_step=edl_max_step(mode, mission_events))
+            t_part = sol.t
+            Y_part = sol.y
+        else:
+            # only ask for the end of the time span. When a (terminal)
+            # event stops the stage, its state is the final state and is
+            # taken from y_events; it is the same value the solver would
+            # have stored as the last step.
+            sol = solve_ivp(fun, tspan, y0, method='DOP853', events=events,
+                            max_step=edl_max_step(mode, mission_events),
+                            t_eval=[tspan[1]])
+            if sol.status == 1:
+                fired = [i for i in range(len(sol.t_events)) if sol.t_events[i].size != 0]
+                last = max(fired, key=lambda i: sol.t_events[i][-1])
+                t_part = sol.t_events[last][-1:]
+                Y_part = sol.y_events[last][-1].reshape(-1, 1).copy()
+            elif sol.status == 0:
+                t_part = sol.t
+                Y_part = sol.y
+            else:
+                raise Exception('EDL simulation failed: ' + sol.message)
+        nfev = nfev + sol.nfev
         TE = sol.t_events
         YE = sol.y_events
 
@@ -1607,14 +3038,14 @@ def simulate_edl(edl_system, planet, mission_events, tmax, ITER_INFO):
         # update the simulation time span for the next stage
         tspan = (t_part[-1], tmax)
         
-        # appending to grow a list is inefficient, but there is no way to
-        # know in advance how many elements we'll need due to the adaptive step
-        # size in ode45
-        
-        T = np.append(T, t_part)
-        Y = np.hstack((Y, Y_part))
-        #T.append(t_part)
-        #Y.append(Y_part)
+        # there is no way to know in advance how many elements we'll need due
+        # to the adaptive step size, so collect the pieces
+        if record == 'none':
+            T_parts = [t_part]
+            Y_parts = [Y_part]
+        else:
+            T_parts.append(t_part)
+            Y_parts.append(Y_part)
 
         
         # This looks for whether we're out of time. other termination
@@ -1622,14 +3053,24 @@ def simulate_edl(edl_system, planet, mission_events, tmax, ITER_INFO):
         if tspan[0] >= tspan[1]:
             TERMINATE_SIM = True
     
+    if len(T_parts) == 1:
+        T = T_parts[0]
+        Y = Y_parts[0]
+    else:
+        T = np.concatenate(T_parts)
+        Y = np.concatenate(Y_parts, axis=1)
+    
+    if stats is not None:
+        stats['nfev'] = nfev
+    
     return T, Y, edl_system
     
-def obj_fun_time(x,edl_system,planet,mission_events,tmax,experiment,end_event):
-    # OBJ_FUN_TIME
-    # 
-    # This function runs both simulations -- edl and rover -- to get a total
-    # time to land and travel the specified terrain. 
+def simulate_design(x,edl_system,planet,mission_events,tmax,experiment,end_event):
+    # SIMULATE_DESIGN
     #
+    # Runs both simulations -- edl and rover -- for the design vector x and
+    # returns the time to land and the edl_system after the rover traverse.
+    # This is the part shared by obj_fun_time and constraints_edl_system.
     #
     
     
@@ -1639,8 +3080,6 @@ def obj_fun_time(x,edl_system,planet,mission_events,tmax,experiment,end_event):
     # modifying a local copy.
     #
     
-    edl_system = redefine_edl_system(edl_system)
-    
     # edl_system=define_chassis(edl_system,'steel');
     # edl_system=define_motor(edl_system,'speed');
     # edl_system=define_batt_pack(edl_system,'LiFePO4',10);
@@ -1650,14 +3089,9 @@ def obj_fun_time(x,edl_system,planet,mission_events,tmax,experiment,end_event):
     # **
     #
     # Unpack the edl-related design variables and update the struct
-    edl_system['parachute']['diameter'] = x[0]
-    edl_system['rocket']['fuel_mass'] = x[4]
-    edl_system['rocket']['initial_fuel_mass'] = x[4]
-    edl_system['rover']['wheel_assembly']['wheel']['radius'] = x[1]
-    edl_system['rover']['chassis']['mass'] = x[2]
-    edl_system['rover']['wheel_assembly']['speed_reducer']['diam_gear'] = x[3]
+    edl_system = apply_design(x,edl_system)
     #
-    [time_edl_run,_,edl_system] = simulate_edl(edl_system,planet,mission_events,tmax,False)
+    [time_edl_run,_,edl_system] = simulate_edl(edl_system,planet,mission_events,tmax,False,'none')
     time_edl = time_edl_run[-1]
     #
     # *****************
@@ -1667,10 +3101,41 @@ def obj_fun_time(x,edl_system,planet,mission_events,tmax,experiment,end_event):
     # RUNNING THE ROVER SIMULATION
     #
     edl_system['rover'] = simulate_rover(edl_system['rover'],planet,experiment,end_event)
-    time_rover = edl_system['rover']['telemetry']['completion_time']
     #
     # ****************
     
+    return time_edl, edl_system
+
+def apply_design(x,edl_system):
+    # APPLY_DESIGN
+    #
+    # Resets the edl_system to its pre-launch state (redefine_edl_system)
+    # and writes the design vector x into it:
+    #   x = [parachute diameter, wheel radius, chassis mass, d2, fuel mass]
+    #
+    
+    edl_system = redefine_edl_system(edl_system)
+    
+    edl_system['parachute']['diameter'] = x[0]
+    edl_system['rocket']['fuel_mass'] = x[4]
+    edl_system['rocket']['initial_fuel_mass'] = x[4]
+    edl_system['rover']['wheel_assembly']['wheel']['radius'] = x[1]
+    edl_system['rover']['chassis']['mass'] = x[2]
+    edl_system['rover']['wheel_assembly']['speed_reducer']['diam_gear'] = x[3]
+    
+    return edl_system
+
+def obj_fun_time(x,edl_system,planet,mission_events,tmax,experiment,end_event):
+    # OBJ_FUN_TIME
+    # 
+    # This function runs both simulations -- edl and rover -- to get a total
+    # time to land and travel the specified terrain. 
+    #
+    #
+    
+    time_edl, edl_system = simulate_design(x,edl_system,planet,mission_events,tmax,experiment,end_event)
+    time_rover = edl_system['rover']['telemetry']['completion_time']
+    
     
     # ******************
     # CALCULATE TOTAL TIME
@@ -1688,45 +3153,16 @@ def constraints_edl_system(x,edl_system,planet,mission_events,tmax,experiment,en
     # To evaluate the constraints entails simulating both the edl system and the
     # rover. Thus, this function calls simulate_edl and simulate_rover.
     #
-
-    edl_system = redefine_edl_system(edl_system)
-    
-    # CONSTRAINTS_EDL_SYSTEM
-    # 
-    
-    # edl_system=define_chassis(edl_system,'steel');
-    # edl_system=define_motor(edl_system,'speed');
-    # edl_system=define_batt_pack(edl_system,'LiFePO4',10);
     
+    _, edl_system = simulate_design(x,edl_system,planet,mission_events,tmax,experiment,end_event)
     
-    # ****************
-    # RUNNING THE EDL SIMULATION
-    # **
-    #
-    # Unpack the edl-related design variables and update the struct
-    edl_system['parachute']['diameter'] = x[0]
-    edl_system['rocket']['fuel_mass'] = x[4]
-    edl_system['rocket']['initial_fuel_mass'] = x[4]
-    edl_system['rover']['wheel_assembly']['wheel']['radius'] = x[1]
-    edl_system['rover']['chassis']['mass'] = x[2]
-    edl_system['rover']['wheel_assembly']['speed_reducer']['diam_gear'] = x[3]
-    
+    return design_constraints(edl_system,end_event,min_strength,max_rover_velocity,max_cost,max_batt_energy_per_meter)
 
+def design_constraints(edl_system,end_event,min_strength,max_rover_velocity,max_cost,max_batt_energy_per_meter):
+    # design_constraints
     #
-    # run the edl simulation
-    _, _, edl_system = simulate_edl(edl_system,planet,mission_events,tmax,False)
-    # time_edl = time_edl_run(end);
-    #
-    # *****************
-    
-    
-    # *****************
-    # RUNNING THE ROVER SIMULATION
-    # **
-    #
-    # run the rover simulation
-    edl_system['rover'] = simulate_rover(edl_system['rover'],planet,experiment,end_event)
-    # time_rover = edl_system.rover.telemetry.completion_time;
+    # Evaluates the constraint functions from an edl_system that has been
+    # through simulate_design.
     #
     
     # *****************
@@ -1760,6 +3196,451 @@ def constraints_edl_system(x,edl_system,planet,mission_events,tmax,experiment,en
     
     return np.array(c)
 
+def _fingerprint(h, obj):
+    
+    # Feeds a canonical description of obj (dicts, sequences, numpy arrays,
+    # numbers, strings, functions and slotted objects such as
+    # AtmosphereTable) into the hashlib object h. Equal inputs always give
+    # the same bytes, independent of dict insertion order.
+    
+    if isinstance(obj, dict):
+        h.update(b'd')
+        for key in sorted(obj, key=repr):
+            _fingerprint(h, key)
+            _fingerprint(h, obj[key])
+        h.update(b'e')
+    elif isinstance(obj, (list, tuple)):
+        h.update(b'l')
+        for item in obj:
+            _fingerprint(h, item)
+        h.update(b'e')
+    elif isinstance(obj, np.ndarray):
+        h.update(b'a' + repr((obj.dtype.str, obj.shape)).encode())
+        h.update(np.ascontiguousarray(obj).tobytes())
+    elif obj is None or isinstance(obj, (bool, int, float, str, np.generic)):
+        h.update(b's' + repr(obj).encode() + b';')
+    elif callable(obj) and hasattr(obj, '__code__'):
+        # the model itself: its name, bytecode and constants
+        code = obj.__code__
+        h.update(b'f' + repr((obj.__module__, obj.__qualname__, code.co_consts)).encode())
+        h.update(code.co_code)
+    elif hasattr(obj, '__slots__'):
+        h.update(b'o' + type(obj).__qualname__.encode())
+        _fingerprint(h, [getattr(obj, name) for name in obj.__slots__])
+    else:
+        raise Exception('cannot fingerprint object of type {}'.format(type(obj).__name__))
+
+class DesignStore:
+    """
+    Append-only SQLite file of design evaluation results.
+
+    Inputs:          path:  string        File of the store (created if it
+                                          does not exist)
+
+    Results are keyed by the hex digest DesignEvaluator forms from its
+    design vector and its fingerprint, and stored as the float64 bytes of
+    [total time, constraints]. Rows are only ever inserted, and each insert
+    is committed right away, so an interrupted optimization keeps what it
+    had evaluated and a later run with the same setup picks it up.
+    """
+
+    __slots__ = ('path', 'connection')
+
+    def __init__(self, path):
+
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.execute('CREATE TABLE IF NOT EXISTS designs '
+                                '(key TEXT PRIMARY KEY, result BLOB NOT NULL)')
+        self.connection.commit()
+
+    def __len__(self):
+        return self.connection.execute('SELECT COUNT(*) FROM designs').fetchone()[0]
+
+    def get(self, key):
+        """Returns (total time, constraint array) stored under key, or None."""
+
+        row = self.connection.execute('SELECT result FROM designs WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        values = np.frombuffer(row[0], dtype='<f8')
+        return float(values[0]), values[1:].copy()
+
+    def put(self, items):
+        """Stores (key, (total time, constraint array)) pairs."""
+
+        rows = [(key, np.concatenate(([total_time], c)).astype('<f8').tobytes())
+                for key, (total_time, c) in items]
+        self.connection.executemany('INSERT OR IGNORE INTO designs VALUES (?, ?)', rows)
+        self.connection.commit()
+
+    def close(self):
+        self.connection.close()
+
+# version of the results kept in a DesignStore. Increase it whenever a
+# change to the models or solvers changes simulation results, so results
+# stored by earlier code are no longer found.
+DESIGN_STORE_VERSION = 1
+
+class DesignEvaluator:
+    """
+    Objective and constraints of the design optimization from one simulation
+    per design vector.
+
+    Inputs:    edl_system:  dict          EDL system with the chosen chassis,
+                                          motor and battery
+                   planet:  dict          Planet
+           mission_events:  dict          Mission events
+                     tmax:  scalar        Maximum EDL simulation time [s]
+               experiment:  dict          Rover experiment
+                end_event:  dict          Rover end conditions
+    min_strength, max_rover_velocity, max_cost, max_batt_energy_per_meter:
+                            scalars       Constraint limits, as in
+                                          constraints_edl_system
+                  maxsize:  int           (optional) Number of designs kept
+                                          (least recently used are dropped)
+                  workers:  callable      (optional) map-like callable used
+                                          to simulate the designs of a
+                                          population, e.g. the map method of
+                                          a multiprocessing.Pool
+                    store:  string        (optional) Path of a DesignStore
+                                          file that results are looked up in
+                                          and appended to
+              rover_batch:  int           (optional) Number of rover designs
+                                          per simulate_rover_batch call
+              fingerprint:  string        (optional) Fingerprint of the inputs
+                                          above, if already known
+
+    objective(x) and constraints(x) return the same values as obj_fun_time
+    and constraints_edl_system, but the EDL and rover simulations are run
+    once per design vector: the optimizer asking for the objective, the
+    constraints and the value to report for the same x costs one run.
+    Results are keyed on the exact values of x.
+
+    The EDL and rover simulations are also cached separately, each keyed
+    on its own inputs (edl_key: parachute diameter, fuel mass and rover
+    mass; rover_key: wheel radius, d2 and chassis mass). A design that only
+    differs from a known one in the rover variables reuses its descent, and
+    one that only differs in parachute or fuel reuses its traverse.
+    num_simulations counts the designs that were not known yet;
+    num_edl_simulations and num_rover_simulations count the runs of each
+    simulation.
+
+    Every run starts from a fresh copy of the edl_system given here, so a
+    result does not depend on which designs were simulated before it, and
+    the evaluator pickles (without its cache) for use in worker processes.
+    Given a 2-D x with one design per column (differential_evolution with
+    vectorized=True), objective and constraints evaluate the whole
+    population, simulating the designs not yet known through workers. The
+    rover runs of a population go through simulate_rover_batch in chunks of
+    rover_batch designs, in population order, so the results do not depend
+    on the workers; they agree with a single-design evaluation to within
+    the rover solver tolerance.
+
+    With a store, results also persist across runs. fingerprint is a hash
+    of everything besides x that a result depends on: the edl_system
+    (chassis, motor, battery, ...), planet, mission events, tmax,
+    experiment, end event, constraint limits and DESIGN_STORE_VERSION. It is
+    computed once; copies sent to worker processes carry it along. Designs
+    are looked up in the store under a hash of fingerprint and x before
+    they are simulated, so only changing one of those inputs makes stored
+    results unreachable.
+    """
+
+    __slots__ = ('edl_system', 'planet', 'mission_events', 'tmax', 'experiment',
+                 'end_event', 'limits', 'maxsize', 'workers', 'cache', 'edl_cache',
+                 'rover_cache', 'num_simulations', 'num_edl_simulations',
+                 'num_rover_simulations', 'fingerprint', 'store', 'rover_batch')
+
+    def __init__(self, edl_system, planet, mission_events, tmax, experiment, end_event,
+                 min_strength, max_rover_velocity, max_cost, max_batt_energy_per_meter,
+                 maxsize=256, workers=map, store=None, rover_batch=16, fingerprint=None):
+
+        self.edl_system = deepcopy(edl_system)
+        self.planet = planet
+        self.mission_events = mission_events
+        self.tmax = tmax
+        self.experiment = experiment
+        self.end_event = end_event
+        self.limits = (min_strength, max_rover_velocity, max_cost, max_batt_energy_per_meter)
+        self.maxsize = maxsize
+        self.workers = workers
+        self.rover_batch = rover_batch
+        self.cache = OrderedDict()
+        self.edl_cache = OrderedDict()
+        self.rover_cache = OrderedDict()
+        self.num_simulations = 0
+        self.num_edl_simulations = 0
+        self.num_rover_simulations = 0
+        
+        if fingerprint is None:
+            h = hashlib.sha256()
+            _fingerprint(h, [DESIGN_STORE_VERSION, self.edl_system, planet, mission_events,
+                             tmax, experiment, end_event, list(self.limits)])
+            fingerprint = h.hexdigest()
+        self.fingerprint = fingerprint
+        self.store = None if store is None else DesignStore(store)
+
+    def close(self):
+        """Closes the store (if any); later results are only cached in memory."""
+
+        if self.store is not None:
+            self.store.close()
+            self.store = None
+
+    def __reduce__(self):
+        # workers (e.g. a pool's map), the cache and the store stay in this
+        # process; the fingerprint is passed on instead of computed again
+        return (DesignEvaluator, (self.edl_system, self.planet, self.mission_events,
+                                  self.tmax, self.experiment, self.end_event)
+                                 + self.limits + (self.maxsize, map, None, self.rover_batch,
+                                                  self.fingerprint))
+
+    def prepare(self, key):
+        """Fresh copy of the EDL system with the design vector key applied."""
+
+        return apply_design(np.array(key), deepcopy(self.edl_system))
+
+    def edl_key(self, key):
+        
+        # the descent only depends on the parachute diameter, the fuel mass
+        # and the mass of the rover it carries
+        
+        return (key[0], key[4], get_mass_rover(self.prepare(key)['rover']))
+
+    def rover_key(self, key):
+        
+        # the traverse only depends on the wheel radius, d2 and the chassis
+        # mass (the motor and battery are part of the evaluator's edl_system)
+        
+        return (key[1], key[3], key[2])
+
+    def simulate_edl_part(self, key):
+        """Runs the EDL simulation of a design; returns (time to land, final velocity)."""
+
+        T, _, edl_system = simulate_edl(self.prepare(key), self.planet, self.mission_events,
+                                        self.tmax, False, 'none')
+        return T[-1], edl_system['velocity']
+
+    def simulate_rover_parts(self, keys):
+        """Runs the rover simulations of a list of designs in one batch; returns the telemetry used."""
+
+        telemetry = simulate_rover_batch([self.prepare(key)['rover'] for key in keys], self.planet,
+                                         self.experiment, self.end_event)
+        return [{name: tel[name]
+                 for name in ('completion_time', 'distance_traveled', 'energy_per_distance')}
+                for tel in telemetry]
+
+    def combine(self, key, edl_result, telemetry):
+        """(total time, constraints) of a design from its EDL and rover results."""
+
+        edl_system = self.prepare(key)
+        time_edl, edl_system['velocity'] = edl_result
+        edl_system['rover']['telemetry'] = telemetry
+        total_time = time_edl + telemetry['completion_time']
+        c = design_constraints(edl_system, self.end_event, *self.limits)
+        return total_time, c
+
+    def _remember(self, cache, key, result):
+
+        cache[key] = result
+        if len(cache) > self.maxsize:
+            cache.popitem(last=False)
+
+    def store_key(self, key):
+        """Key of the design vector key (a tuple) in the store."""
+
+        return hashlib.sha256(self.fingerprint.encode()
+                              + np.array(key, dtype='<f8').tobytes()).hexdigest()
+
+    def _lookup(self, key):
+        
+        # cached or stored result of the design key, or None
+        
+        if key in self.cache:
+            self.cache.move_to_end(key)
+            return self.cache[key]
+        if self.store is not None:
+            result = self.store.get(self.store_key(key))
+            if result is not None:
+                self._remember(self.cache, key, result)
+                return result
+        return None
+
+    def _parts(self, cache, part_keys, keys, run, chunk=None):
+        
+        # results of the sub-problems part_keys (one for each design in
+        # keys): cached ones are reused, the others are run on the workers,
+        # once per distinct sub-problem. With chunk, run takes a list of up
+        # to chunk designs and returns a list of results. Also returns the
+        # number of runs.
+        
+        parts = {}
+        todo = {}
+        for part_key, key in zip(part_keys, keys):
+            if part_key in parts or part_key in todo:
+                continue
+            if part_key in cache:
+                cache.move_to_end(part_key)
+                parts[part_key] = cache[part_key]
+            else:
+                todo[part_key] = key
+        todo_keys = list(todo.values())
+        if chunk is None:
+            results = self.workers(run, todo_keys)
+        else:
+            chunks = [todo_keys[ii:ii+chunk] for ii in range(0, len(todo_keys), chunk)]
+            results = [result for results in self.workers(run, chunks) for result in results]
+        for part_key, result in zip(todo, results):
+            parts[part_key] = result
+            self._remember(cache, part_key, result)
+        return parts, len(todo)
+
+    def evaluate(self, x):
+        """Returns (total time, constraint array) of the design x."""
+
+        total_time, c = self.evaluate_population([np.ravel(x)])
+        return total_time[0], c[0]
+
+    def evaluate_population(self, X):
+        """
+        Returns (total times, constraint arrays) of the designs in the rows
+        of X, with shapes (S,) and (S, 5).
+        """
+
+        keys = [tuple(row) for row in np.asarray(X, dtype=float).tolist()]
+        results = {}
+        for key in dict.fromkeys(keys):
+            result = self._lookup(key)
+            if result is not None:
+                results[key] = result
+        missing = [key for key in dict.fromkeys(keys) if key not in results]
+        
+        if missing:
+            edl_keys = [self.edl_key(key) for key in missing]
+            rover_keys = [self.rover_key(key) for key in missing]
+            edl_results, num_edl = self._parts(self.edl_cache, edl_keys, missing,
+                                               self.simulate_edl_part)
+            rover_results, num_rover = self._parts(self.rover_cache, rover_keys, missing,
+                                                   self.simulate_rover_parts, self.rover_batch)
+            for key, edl_key, rover_key in zip(missing, edl_keys, rover_keys):
+                result = self.combine(key, edl_results[edl_key], rover_results[rover_key])
+                results[key] = result
+                self._remember(self.cache, key, result)
+            self.num_simulations = self.num_simulations + len(missing)
+            self.num_edl_simulations = self.num_edl_simulations + num_edl
+            self.num_rover_simulations = self.num_rover_simulations + num_rover
+            if self.store is not None:
+                self.store.put([(self.store_key(key), results[key]) for key in missing])
+        
+        total_time = np.array([results[key][0] for key in keys])
+        c = np.array([results[key][1] for key in keys])
+        return total_time, c
+
+    def objective(self, x):
+        if np.ndim(x) == 2:
+            # (N, S) population -> (S,)
+            return self.evaluate_population(np.transpose(x))[0]
+        return self.evaluate(x)[0]
+
+    def constraints(self, x):
+        if np.ndim(x) == 2:
+            # (N, S) population -> (5, S)
+            return self.evaluate_population(np.transpose(x))[1].T
+        return self.evaluate(x)[1]
+
+def surrogate_optimize(evaluator, bounds, max_evaluations=60, n_initial=None, seed=None):
+    """
+    Surrogate-assisted minimization of evaluator.objective subject to
+    evaluator.constraints(x) <= 0.
+
+    Inputs:     evaluator:  DesignEvaluator   True objective and constraints
+                   bounds:  Bounds or list    Bounds of the design vector
+                                              (scipy Bounds or (min, max)
+                                              pairs)
+          max_evaluations:  int               (optional) Number of true
+                                              evaluations allowed
+                n_initial:  int               (optional) Size of the initial
+                                              Latin hypercube sample
+                                              (default 2*(N+1))
+                     seed:  int               (optional) Seed of the sample
+                                              and of the surrogate searches
+
+    Outputs:          res:  OptimizeResult    x, fun and constr of the best
+                                              feasible design evaluated (the
+                                              best one overall if none is
+                                              feasible), success, nfev (true
+                                              evaluations), nsim (of those,
+                                              simulations actually run, the
+                                              rest came from the evaluator's
+                                              cache or store) and nit
+
+    The initial sample is evaluated as one population (so it runs on the
+    evaluator's workers). After that, thin plate spline RBF surrogates of
+    the objective and the constraints are fitted to all evaluated designs
+    (in coordinates scaled to the unit box), differential_evolution
+    minimizes the surrogate objective under the surrogate constraints, and
+    only that proposal is evaluated truly. A proposal that repeats an
+    evaluated design is replaced by the candidate farthest from all of them.
+    """
+    
+    if hasattr(bounds, 'lb'):
+        lb = np.array(bounds.lb, dtype=float)
+        ub = np.array(bounds.ub, dtype=float)
+    else:
+        lb = np.array([b[0] for b in bounds], dtype=float)
+        ub = np.array([b[1] for b in bounds], dtype=float)
+    n = lb.size
+    if n_initial is None:
+        n_initial = 2*(n + 1)
+    if max_evaluations < n_initial:
+        raise Exception('max_evaluations must be at least n_initial')
+    rng = np.random.default_rng(seed)
+    num_simulations = evaluator.num_simulations
+    
+    # initial space-filling sample, in the unit box
+    U = qmc.LatinHypercube(d=n, seed=rng).random(n_initial)
+    F, C = evaluator.evaluate_population(lb + U*(ub - lb))
+    
+    nit = 0
+    while U.shape[0] < max_evaluations:
+        surrogate = RBFInterpolator(U, np.column_stack((F, C)), kernel='thin_plate_spline')
+        
+        def predict(u):
+            # [objective, constraints] for a design (N,) or population (N, S)
+            values = surrogate(np.atleast_2d(np.transpose(u))).T
+            return values[:, 0] if np.ndim(u) == 1 else values
+        
+        cons = NonlinearConstraint(lambda u: predict(u)[1:], -np.inf, 0)
+        prop = differential_evolution(lambda u: predict(u)[0], [(0, 1)]*n,
+                                      constraints=cons, vectorized=True, updating='deferred',
+                                      polish=False, seed=rng).x
+        
+        distance = np.min(np.linalg.norm(U - prop, axis=1))
+        if distance < 1e-3:
+            # the surrogate optimum is already known; explore instead
+            candidates = rng.random((1000, n))
+            spread = np.min(np.linalg.norm(candidates[:, None, :] - U[None, :, :], axis=2), axis=1)
+            prop = candidates[np.argmax(spread)]
+        
+        f, c = evaluator.evaluate(lb + prop*(ub - lb))
+        U = np.vstack((U, prop))
+        F = np.append(F, f)
+        C = np.vstack((C, c))
+        nit = nit + 1
+    
+    feasible = np.max(C, axis=1) <= 0
+    if np.any(feasible):
+        best = np.flatnonzero(feasible)[np.argmin(F[feasible])]
+    else:
+        best = np.argmin(np.max(C, axis=1))
+    
+    return OptimizeResult(x=lb + U[best]*(ub - lb), fun=F[best], constr=C[best],
+                          success=bool(feasible[best]), nfev=U.shape[0],
+                          nsim=evaluator.num_simulations - num_simulations, nit=nit,
+                          message='best feasible design found' if feasible[best]
+                                  else 'no feasible design found')
+
 def redefine_edl_system(edl_system):
     
     edl_system['altitude'] = 11000
@@ -1894,63 +3775,64 @@ import pickle
 
 np.NaN = np.nan
 
-planet = define_planet()
-mission_events = define_mission_events()
-experiment, end_event = experiment1()
-
-edl_system = define_edl_system()
-edl_system = define_chassis(edl_system, 'magnesium')
-edl_system = define_motor(edl_system, 'speed_he')
-edl_system = define_batt_pack(edl_system, 'NiCD', 37)
-edl_system = redefine_edl_system(edl_system)
-
-# Final EDL design
-edl_system['parachute']['diameter'] = 15.2
-edl_system['rocket']['initial_fuel_mass'] = 260.0
-edl_system['rocket']['fuel_mass'] = 260.0
-
-# Final rover design
-edl_system['rover']['wheel_assembly']['wheel']['radius'] = 0.7
-edl_system['rover']['wheel_assembly']['speed_reducer']['diam_gear'] = 0.05
-edl_system['rover']['chassis']['mass'] = 250.0
-edl_system['rover']['chassis']['strength'] = (
-    edl_system['rover']['chassis']['mass'] *
-    edl_system['rover']['chassis']['specific_strength']
-)
-
-# Replace before submission
-edl_system['team_name'] = 'ReplaceWithTeamName'
-edl_system['team_number'] = 0
-
-# Verify performance
-time_edl_run, _, edl_system = simulate_edl(edl_system, planet, mission_events, 5000, False)
-time_edl = time_edl_run[-1]
-
-edl_system['rover'] = simulate_rover(edl_system['rover'], planet, experiment, end_event)
-time_rover = edl_system['rover']['telemetry']['completion_time']
-total_time = time_edl + time_rover
-total_cost = get_cost_edl(edl_system)
-
-print('Optimized parachute diameter   = {:.6f} [m]'.format(edl_system['parachute']['diameter']))
-print('Optimized rocket fuel mass     = {:.6f} [kg]'.format(edl_system['rocket']['initial_fuel_mass']))
-print('Time to complete EDL mission   = {:.6f} [s]'.format(time_edl))
-print('Rover velocity at landing      = {:.6f} [m/s]'.format(edl_system['rover_touchdown_speed']))
-print('Optimized wheel radius         = {:.6f} [m]'.format(edl_system['rover']['wheel_assembly']['wheel']['radius']))
-print('Optimized d2                   = {:.6f} [m]'.format(edl_system['rover']['wheel_assembly']['speed_reducer']['diam_gear']))
-print('Optimized chassis mass         = {:.6f} [kg]'.format(edl_system['rover']['chassis']['mass']))
-print('Motor type                     = {}'.format(edl_system['rover']['wheel_assembly']['motor']['type']))
-print('Battery type                   = {}'.format(edl_system['rover']['power_subsys']['battery']['battery_type']))
-print('Number of battery modules      = {}'.format(edl_system['rover']['power_subsys']['battery']['num_modules']))
-print('Chassis material               = {}'.format(edl_system['rover']['chassis']['type']))
-print('Time to complete rover mission = {:.6f} [s]'.format(time_rover))
-print('Time to complete mission       = {:.6f} [s]'.format(total_time))
-print('Average velocity               = {:.6f} [m/s]'.format(edl_system['rover']['telemetry']['average_velocity']))
-print('Distance traveled              = {:.6f} [m]'.format(edl_system['rover']['telemetry']['distance_traveled']))
-print('Battery energy per meter       = {:.6f} [J/m]'.format(edl_system['rover']['telemetry']['energy_per_distance']))
-print('Chassis strength               = {:.6f}'.format(edl_system['rover']['chassis']['strength']))
-print('Total cost                     = {:.6f} [$]'.format(total_cost))
-
-with open('FA25_SecYY_TeamXX_candidate.pickle', 'wb') as handle:
-    pickle.dump(edl_system, handle, protocol=pickle.HIGHEST_PROTOCOL)
-
-print('\nSaved: FA25_Sec501_Team48_candidate.pickle')
+if __name__ == '__main__':
+    planet = define_planet()
+    mission_events = define_mission_events()
+    experiment, end_event = experiment1()
+
+    edl_system = define_edl_system()
+    edl_system = define_chassis(edl_system, 'magnesium')
+    edl_system = define_motor(edl_system, 'speed_he')
+    edl_system = define_batt_pack(edl_system, 'NiCD', 37)
+    edl_system = redefine_edl_system(edl_system)
+
+    # Final EDL design
+    edl_system['parachute']['diameter'] = 15.2
+    edl_system['rocket']['initial_fuel_mass'] = 260.0
+    edl_system['rocket']['fuel_mass'] = 260.0
+
+    # Final rover design
+    edl_system['rover']['wheel_assembly']['wheel']['radius'] = 0.7
+    edl_system['rover']['wheel_assembly']['speed_reducer']['diam_gear'] = 0.05
+    edl_system['rover']['chassis']['mass'] = 250.0
+    edl_system['rover']['chassis']['strength'] = (
+        edl_system['rover']['chassis']['mass'] *
+        edl_system['rover']['chassis']['specific_strength']
+    )
+
+    # Replace before submission
+    edl_system['team_name'] = 'ReplaceWithTeamName'
+    edl_system['team_number'] = 0
+
+    # Verify performance
+    time_edl_run, _, edl_system = simulate_edl(edl_system, planet, mission_events, 5000, False)
+    time_edl = time_edl_run[-1]
+
+    edl_system['rover'] = simulate_rover(edl_system['rover'], planet, experiment, end_event)
+    time_rover = edl_system['rover']['telemetry']['completion_time']
+    total_time = time_edl + time_rover
+    total_cost = get_cost_edl(edl_system)
+
+    print('Optimized parachute diameter   = {:.6f} [m]'.format(edl_system['parachute']['diameter']))
+    print('Optimized rocket fuel mass     = {:.6f} [kg]'.format(edl_system['rocket']['initial_fuel_mass']))
+    print('Time to complete EDL mission   = {:.6f} [s]'.format(time_edl))
+    print('Rover velocity at landing      = {:.6f} [m/s]'.format(edl_system['rover_touchdown_speed']))
+    print('Optimized wheel radius         = {:.6f} [m]'.format(edl_system['rover']['wheel_assembly']['wheel']['radius']))
+    print('Optimized d2                   = {:.6f} [m]'.format(edl_system['rover']['wheel_assembly']['speed_reducer']['diam_gear']))
+    print('Optimized chassis mass         = {:.6f} [kg]'.format(edl_system['rover']['chassis']['mass']))
+    print('Motor type                     = {}'.format(edl_system['rover']['wheel_assembly']['motor']['type']))
+    print('Battery type                   = {}'.format(edl_system['rover']['power_subsys']['battery']['battery_type']))
+    print('Number of battery modules      = {}'.format(edl_system['rover']['power_subsys']['battery']['num_modules']))
+    print('Chassis material               = {}'.format(edl_system['rover']['chassis']['type']))
+    print('Time to complete rover mission = {:.6f} [s]'.format(time_rover))
+    print('Time to complete mission       = {:.6f} [s]'.format(total_time))
+    print('Average velocity               = {:.6f} [m/s]'.format(edl_system['rover']['telemetry']['average_velocity']))
+    print('Distance traveled              = {:.6f} [m]'.format(edl_system['rover']['telemetry']['distance_traveled']))
+    print('Battery energy per meter       = {:.6f} [J/m]'.format(edl_system['rover']['telemetry']['energy_per_distance']))
+    print('Chassis strength               = {:.6f}'.format(edl_system['rover']['chassis']['strength']))
+    print('Total cost                     = {:.6f} [$]'.format(total_cost))
+
+    with open('FA25_SecYY_TeamXX_candidate.pickle', 'wb') as handle:
+        pickle.dump(edl_system, handle, protocol=pickle.HIGHEST_PROTOCOL)
+
+    print('\nSaved: FA25_Sec501_Team48_candidate.pickle')
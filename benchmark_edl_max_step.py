@@ -0,0 +1,63 @@
+import time
+import numpy as np
+
+import Sec501Team48code as sec501
+
+
+# -----------------------------
+# Designs and solver settings
+# -----------------------------
+planet = sec501.define_planet()
+tmax = 5000
+
+# (parachute diameter [m], fuel mass per rocket [kg]) around the candidate
+designs = [(15.2, 260.0), (14.0, 230.0), (16.5, 250.0), (18.0, 280.0)]
+
+phases = ['descent', 'full_thrust', 'speed_control', 'position_control']
+
+# the former setting (0.1 s everywhere), the phase-aware default of
+# define_mission_events, and a reference with 0.01 s everywhere
+settings = {'uniform 0.1': {phase: 0.1 for phase in phases},
+            'per phase': sec501.define_mission_events()['max_step']}
+reference = {phase: 0.01 for phase in phases}
+
+
+def define_design(diameter, fuel_mass):
+    edl_system = sec501.define_edl_system()
+    edl_system = sec501.define_chassis(edl_system, 'magnesium')
+    edl_system = sec501.define_motor(edl_system, 'speed_he')
+    edl_system = sec501.define_batt_pack(edl_system, 'NiCD', 37)
+    edl_system = sec501.redefine_edl_system(edl_system)
+    edl_system['parachute']['diameter'] = diameter
+    edl_system['rocket']['initial_fuel_mass'] = fuel_mass
+    edl_system['rocket']['fuel_mass'] = fuel_mass
+    edl_system['rover']['wheel_assembly']['wheel']['radius'] = 0.7
+    edl_system['rover']['wheel_assembly']['speed_reducer']['diam_gear'] = 0.05
+    edl_system['rover']['chassis']['mass'] = 250.0
+    return edl_system
+
+
+def run(max_step, design):
+    mission_events = sec501.define_mission_events()
+    mission_events['max_step'] = max_step
+    edl_system = define_design(*design)
+    stats = {}
+    t0 = time.perf_counter()
+    T, _, edl_system = sec501.simulate_edl(edl_system, planet, mission_events, tmax, False,
+                                           stats=stats)
+    return T[-1], edl_system['rover_touchdown_speed'], stats['nfev'], time.perf_counter() - t0
+
+
+# -----------------------------
+# RHS calls and accuracy
+# -----------------------------
+# the 0.01 s reference only depends on the design, so run it once per design
+references = {design: run(reference, design)[:2] for design in designs}
+
+for name, max_step in settings.items():
+    print('\n{}: {}'.format(name, max_step))
+    print(f"{'design':<14}{'RHS calls':>10}{'time [s]':>10}{'landing t err [s]':>19}{'touchdown v err [m/s]':>23}")
+    for design in designs:
+        t_ref, v_ref = references[design]
+        t_end, v_td, nfev, elapsed = run(max_step, design)
+        print(f"{str(design):<14}{nfev:>10}{elapsed:>10.3f}{abs(t_end - t_ref):>19.2e}{abs(v_td - v_ref):>23.2e}")
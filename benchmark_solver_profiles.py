@@ -0,0 +1,106 @@
+import copy
+import time
+import numpy as np
+
+import subfunctions
+import Sec501Team48code as sec501
+
+
+# -----------------------------
+# Rovers, planet and experiment
+# -----------------------------
+planet = sec501.define_planet()
+experiment, end_event = sec501.experiment1()
+
+# Sec501Team48code: candidate design
+edl_system = sec501.define_edl_system()
+edl_system = sec501.define_chassis(edl_system, 'magnesium')
+edl_system = sec501.define_motor(edl_system, 'speed_he')
+edl_system = sec501.define_batt_pack(edl_system, 'NiCD', 37)
+edl_system = sec501.redefine_edl_system(edl_system)
+edl_system['rover']['wheel_assembly']['wheel']['radius'] = 0.7
+edl_system['rover']['wheel_assembly']['speed_reducer']['diam_gear'] = 0.05
+edl_system['rover']['chassis']['mass'] = 250.0
+
+# subfunctions: Phase 1 rover (efficiency table kept positive at zero
+# torque, which subfunctions.battenergy requires)
+rover_phase1 = {
+    'wheel_assembly': {
+        'wheel': {'radius': 0.30, 'mass': 1.0},
+        'speed_reducer': {'type': 'reverted', 'diam_pinion': 0.04,
+                          'diam_gear': 0.07, 'mass': 1.5},
+        'motor': {'torque_stall': 170.0, 'torque_noload': 0.0,
+                  'speed_noload': 3.80, 'mass': 5.0,
+                  'effcy_tau': np.array([0, 10, 20, 40, 75, 165]),
+                  'effcy': np.array([0.1, 0.60, 0.75, 0.73, 0.55, 0.05])}
+    },
+    'chassis': {'mass': 659.0},
+    'science_payload': {'mass': 75.0},
+    'power_subsys': {'mass': 90.0}
+}
+
+# the EDL planet of Sec501Team48code stores g as a negative number, the
+# Phase 1 functions expect it positive
+planet_phase1 = {'g': 3.72}
+
+rovers = {sec501: edl_system['rover'], subfunctions: rover_phase1}
+planets = {sec501: planet, subfunctions: planet_phase1}
+
+# Reference trajectory: explicit high order method at tight tolerances, on
+# a fine grid so the trapezoidal battery energy is converged too
+reference_profile = {'method': 'DOP853', 'rtol': 1e-11, 'atol': 1e-12,
+                     'max_step': 0.25}
+
+# average_velocity is left out: Sec501Team48code takes the plain mean of
+# the (non-uniform) output samples, so it tracks the step pattern rather
+# than the trajectory
+telemetry_keys = ['completion_time', 'distance_traveled', 'max_velocity',
+                  'energy_per_distance']
+
+
+def run(module, profile):
+    t0 = time.perf_counter()
+    tel = module.simulate_rover(copy.deepcopy(rovers[module]), planets[module], experiment,
+                                end_event, profile)['telemetry']
+    return tel, time.perf_counter() - t0
+
+
+# -----------------------------
+# Timings per profile
+# -----------------------------
+for module in (sec501, subfunctions):
+    ref, t_ref = run(module, reference_profile)
+    print('\n{}  (reference: {} RHS calls, {:.2f} s)'.format(module.__name__, ref['solver_nfev'], t_ref))
+    print(f"{'profile':<10}{'RHS calls':>10}{'time [s]':>10}{'max rel err':>14}  worst telemetry")
+    for name in module.ROVER_SOLVER_PROFILES:
+        tel, t = run(module, name)
+        errs = {k: abs(tel[k] / ref[k] - 1) for k in telemetry_keys}
+        worst = max(errs, key=errs.get)
+        print(f"{name:<10}{tel['solver_nfev']:>10}{t:>10.3f}{errs[worst]:>14.2e}  {worst}")
+
+
+# -----------------------------
+# Batch solve per profile
+# -----------------------------
+# four variants of the candidate rover (ROVER_BATCH_MIN, so they really
+# are integrated as one system) solved together by simulate_rover_batch,
+# checked against the reference of each one
+batch_rovers = []
+for radius in (0.55, 0.6, 0.7, 0.8):
+    rover = copy.deepcopy(edl_system['rover'])
+    rover['wheel_assembly']['wheel']['radius'] = radius
+    batch_rovers.append(rover)
+batch_refs = [sec501.simulate_rover(copy.deepcopy(rover), planet, experiment, end_event,
+                                    reference_profile)['telemetry'] for rover in batch_rovers]
+
+print('\nsimulate_rover_batch  ({} rovers)'.format(len(batch_rovers)))
+print(f"{'profile':<10}{'time [s]':>10}{'max rel err':>14}  worst telemetry")
+for name in sec501.ROVER_SOLVER_PROFILES:
+    t0 = time.perf_counter()
+    tels = sec501.simulate_rover_batch(copy.deepcopy(batch_rovers), planet, experiment,
+                                       end_event, name)
+    t = time.perf_counter() - t0
+    errs = {(i, k): abs(tel[k] / ref[k] - 1)
+            for i, (tel, ref) in enumerate(zip(tels, batch_refs)) for k in telemetry_keys}
+    worst = max(errs, key=errs.get)
+    print(f"{name:<10}{t:>10.3f}{errs[worst]:>14.2e}  rover {worst[0]}: {worst[1]}")
@@ -0,0 +1,88 @@
+import timeit
+import numpy as np
+
+from subfunctions import (F_net, _F_net_unchecked, compile_rover,
+                          rover_dynamics, TerrainProfile)
+
+
+# -----------------------------
+# Define planet dictionary
+# -----------------------------
+planet = {
+    'g': 3.72
+}
+
+
+# -----------------------------
+# Define rover dictionary
+# -----------------------------
+rover = {
+    'wheel_assembly': {
+        'wheel': {
+            'radius': 0.30,
+            'mass': 1.0
+        },
+        'speed_reducer': {
+            'type': 'reverted',
+            'diam_pinion': 0.04,
+            'diam_gear': 0.07,
+            'mass': 1.5
+        },
+        'motor': {
+            'torque_stall': 170.0,
+            'torque_noload': 0.0,
+            'speed_noload': 3.80,
+            'mass': 5.0,
+            'effcy_tau': np.array([0, 10, 20, 40, 75, 165]),
+            'effcy': np.array([0, 0.55, 0.75, 0.71, 0.50, 0.05])
+        }
+    },
+    'chassis': {
+        'mass': 659.0
+    },
+    'science_payload': {
+        'mass': 75.0
+    },
+    'power_subsys': {
+        'mass': 90.0
+    }
+}
+
+
+# -----------------------------
+# Define experiment dictionary
+# -----------------------------
+experiment = {
+    'alpha_dist': np.array([0, 100, 200, 300, 400, 500, 600, 700, 800, 900, 1000]),
+    'alpha_deg': np.array([11.509, 2.032, 7.182, 2.478, 5.511, 10.981,
+                           5.601, -0.184, 0.714, 4.151, 4.042]),
+    'Crr': 0.1
+}
+
+
+# -----------------------------
+# Per-call timings
+# -----------------------------
+N = 5000
+
+params = compile_rover(rover)
+terrain = TerrainProfile(experiment['alpha_dist'], experiment['alpha_deg'])
+y = np.array([0.3, 250.0])
+omega = 3.0
+angle = 5.0
+
+cases = [
+    ('F_net (validated)',
+     lambda: F_net(omega, angle, rover, planet, experiment['Crr'])),
+    ('_F_net_unchecked',
+     lambda: _F_net_unchecked(omega, angle, params, planet['g'], experiment['Crr'])),
+    ('rover_dynamics (validated)',
+     lambda: rover_dynamics(0.0, y, rover, planet, experiment, terrain)),
+    ('rover_dynamics (params, unchecked)',
+     lambda: rover_dynamics(0.0, y, rover, planet, experiment, terrain, params)),
+]
+
+print(f"{'call':<38}{'us/call':>10}")
+for name, fun in cases:
+    t = timeit.timeit(fun, number=N) / N
+    print(f"{name:<38}{t * 1e6:>10.2f}")
@@ -7,11 +7,13 @@ Created on Mon Nov 15 22:58:03 2021
 """
 
 import numpy as np
-from subfunctions_Phase4 import *
-from define_experiment import *
+# Sec501Team48code holds the Phase 4 subfunctions, experiment1 (from
+# define_experiment) and the DesignEvaluator/surrogate_optimize used below
+from Sec501Team48code import *
 from scipy.optimize import minimize, differential_evolution
 from scipy.optimize import Bounds
 from scipy.optimize import NonlinearConstraint
+from multiprocessing import Pool
 import pickle
 import sys
 
@@ -61,164 +63,211 @@ bounds = Bounds([17.5, 0.4, 1050, 0.05, 210], [19, 0.55, 1400, 0.071, 290])
 # initial guess
 x0 = np.array([18.9, .5, 1250, 0.07, 250.0]) 
 
-# lambda for the objective function
-obj_f = lambda x: obj_fun_time(x,edl_system,planet,mission_events,tmax,
-                               experiment,end_event)
-
-# lambda for the constraint functions
-#   ineq_cons is for SLSQP
-#   nonlinear_constraint is for trust-constr
-cons_f = lambda x: constraints_edl_system(x,edl_system,planet,mission_events,
-                                          tmax,experiment,end_event,min_strength,
-                                          max_rover_velocity,max_cost,max_batt_energy_per_meter)
-
-nonlinear_constraint = NonlinearConstraint(cons_f, -np.inf, 0)  # for trust-constr
-ineq_cons = {'type' : 'ineq',
-             'fun' : lambda x: -1*constraints_edl_system(x,edl_system,planet,
-                                                         mission_events,tmax,experiment,
-                                                         end_event,min_strength,max_rover_velocity,
-                                                         max_cost,max_batt_energy_per_meter)}
-
-Nfeval = 1
-def callbackF(Xi):  # this is for SLSQP reporting during optimization
-    global Nfeval
-    if Nfeval == 1:
-        print('Iter        x0         x1        x2        x3         x4           fval')
-        
-    print('{0:4d}   {1: 3.6f}   {2: 3.6f}   {3: 3.6f}   {4: 3.6f}  {5: 3.6f} \
-          {6: 3.6f}'.format(Nfeval, Xi[0], Xi[1], Xi[2], Xi[3], Xi[4], obj_f(Xi)))
-    Nfeval += 1
-
-
-
-# The optimizer options below are
-# 'trust-constr'
-# 'SLSQP'
-# 'differential_evolution'
-# 'COBYLA'
-# You should fully comment out all but the one you wish to use
-
-###############################################################################
-#call the trust-constr optimizer --------------------------------------------#
-#options = {'maxiter': 5, 
-            # 'initial_constr_penalty' : 5.0,
-            # 'initial_barrier_parameter' : 1.0,
- #           'verbose' : 3,
- #           'disp' : True}
-#res = minimize(obj_f, x0, method='trust-constr', constraints=nonlinear_constraint, 
-  #              options=options, bounds=bounds)
-# end call to the trust-constr optimizer -------------------------------------#
-###############################################################################
-
-###############################################################################
-# call the SLSQP optimizer ---------------------------------------------------#
-#options = {'maxiter': 5,
-#             'disp' : True}
-#res = minimize(obj_f, x0, method='SLSQP', constraints=ineq_cons, bounds=bounds, 
-  #               options=options, callback=callbackF)
-# end call to the SLSQP optimizer --------------------------------------------#
-###############################################################################
-
-###############################################################################
-# call the differential evolution optimizer ----------------------------------#
-popsize=5 # define the population size
-maxiter=5 # define the maximum number of iterations
-res = differential_evolution(obj_f, bounds=bounds, constraints=nonlinear_constraint, popsize=popsize, maxiter=maxiter, disp=True, polish = False) 
-# end call the differential evolution optimizer ------------------------------#
-###############################################################################
-
-###############################################################################
-# call the COBYLA optimizer --------------------------------------------------#
-# cobyla_bounds = [[14, 19], [0.2, 0.7], [250, 800], [0.05, 0.12], [100, 290]]
-# #construct the bounds in the form of constraints
-# cons_cobyla = []
-# for factor in range(len(cobyla_bounds)):
-    # lower, upper = cobyla_bounds[factor]
-    # l = {'type': 'ineq',
-          # 'fun': lambda x, lb=lower, i=factor: x[i] - lb}
-    # u = {'type': 'ineq',
-          # 'fun': lambda x, ub=upper, i=factor: ub - x[i]}
-    # cons_cobyla.append(l)
-    # cons_cobyla.append(u)
-    # cons_cobyla.append(ineq_cons)  # the rest of the constraints
-# options = {'maxiter': 50, 
-            # 'disp' : True}
-# res = minimize(obj_f, x0, method='COBYLA', constraints=cons_cobyla, options=options)
-# end call to the COBYLA optimizer -------------------------------------------#
-###############################################################################
-
-
-# check if we have a feasible solution 
-c = constraints_edl_system(res.x,edl_system,planet,mission_events,tmax,experiment,
-                           end_event,min_strength,max_rover_velocity,max_cost,
-                           max_batt_energy_per_meter)
-
-feasible = np.max(c - np.zeros(len(c))) <= 0
-if feasible:
-    xbest = res.x
-    fbest = res.fun
-else:  # nonsense to let us know this did not work
-    xbest = [99999, 99999, 99999, 99999, 99999]
-    fval = [99999]
-    raise Exception('Solution not feasible, exiting code...')
-    sys.exit()
-
-# What about the design variable bounds?
-
-# The following will rerun your best design and present useful information
-# about the performance of the design
-# This will be helpful if you choose to create a loop around your optimizers and their initializations
-# to try different starting points for the optimization.
-edl_system = redefine_edl_system(edl_system)
-
-edl_system['parachute']['diameter'] = xbest[0]
-edl_system['rover']['wheel_assembly']['wheel']['radius'] = xbest[1]
-edl_system['rover']['chassis']['mass'] = xbest[2]
-edl_system['rover']['wheel_assembly']['speed_reducer']['diam_gear'] = xbest[3]
-edl_system['rocket']['initial_fuel_mass'] = xbest[4]
-edl_system['rocket']['fuel_mass'] = xbest[4]
-
-# *****************************************************************************
-# These lines save your design for submission for the rover competition.
-# You will want to change them to match your team information.
-
-edl_system['team_name'] = 'FunTeamName'  # change this to something fun for your team (or just your team number)
-edl_system['48'] = 48    # change this to your assigned team number (also change it below when saving your pickle file)
-
-# This will create a file that you can submit as your competition file.
-with open('SP26_501team48.pickle', 'wb') as handle:
-    pickle.dump(edl_system, handle, protocol=pickle.HIGHEST_PROTOCOL)
-# *****************************************************************************
-
-#del edl_system
-#with open('challenge_design_team9999.pickle', 'rb') as handle:
-#    edl_system = pickle.load(handle)
-
-time_edl_run,_,edl_system = simulate_edl(edl_system,planet,mission_events,tmax,True)
-time_edl = time_edl_run[-1]
-
-edl_system['rover'] = simulate_rover(edl_system['rover'],planet,experiment,end_event)
-time_rover = edl_system['rover']['telemetry']['completion_time']
-
-total_time = time_edl + time_rover
+# the optimization only runs when this file is executed (not when the worker
+# processes of the pool import it). The evaluator is built here too, so a
+# worker importing this file does not open the store; the workers get the
+# evaluator (without its cache and store) pickled along with their tasks.
+if __name__ == '__main__':
+
+    # the objective, the constraints and the callback below all ask for the same
+    # design vectors; the evaluator simulates each design once and serves all of
+    # them from that run (same values as obj_fun_time and constraints_edl_system,
+    # to within the rover solver tolerance: the rover runs of a population are
+    # integrated together by simulate_rover_batch).
+    # It works on its own copy of edl_system, so it can be sent to worker
+    # processes. Results are also appended to the store file: a rerun with the
+    # same chassis/motor/battery, planet and experiment (or a run that was
+    # interrupted) reuses every design evaluated before instead of simulating it
+    # again. Delete the file to start from scratch.
+    evaluator = DesignEvaluator(edl_system,planet,mission_events,tmax,experiment,
+                                end_event,min_strength,max_rover_velocity,max_cost,
+                                max_batt_energy_per_meter,store='opt_edl_sys_designs.sqlite')
+
+    # the objective function
+    obj_f = evaluator.objective
+
+    # the constraint functions
+    #   ineq_cons is for SLSQP
+    #   nonlinear_constraint is for trust-constr
+    cons_f = evaluator.constraints
+
+    nonlinear_constraint = NonlinearConstraint(cons_f, -np.inf, 0)  # for trust-constr
+    ineq_cons = {'type' : 'ineq',
+                 'fun' : lambda x: -1*evaluator.constraints(x)}
+
+    Nfeval = 1
+    def callbackF(Xi):  # this is for SLSQP reporting during optimization
+        global Nfeval
+        if Nfeval == 1:
+            print('Iter        x0         x1        x2        x3         x4           fval')
+
+        print('{0:4d}   {1: 3.6f}   {2: 3.6f}   {3: 3.6f}   {4: 3.6f}  {5: 3.6f} \
+              {6: 3.6f}'.format(Nfeval, Xi[0], Xi[1], Xi[2], Xi[3], Xi[4], obj_f(Xi)))
+        Nfeval += 1
+
+
+    # The optimizer options below are
+    # 'trust-constr'
+    # 'SLSQP'
+    # 'differential_evolution'
+    # 'surrogate'
+    # 'COBYLA'
+    # You should fully comment out all but the one you wish to use
+
+    ###############################################################################
+    #call the trust-constr optimizer --------------------------------------------#
+    #options = {'maxiter': 5, 
+                # 'initial_constr_penalty' : 5.0,
+                # 'initial_barrier_parameter' : 1.0,
+     #           'verbose' : 3,
+     #           'disp' : True}
+    #res = minimize(obj_f, x0, method='trust-constr', constraints=nonlinear_constraint, 
+      #              options=options, bounds=bounds)
+    # end call to the trust-constr optimizer -------------------------------------#
+    ###############################################################################
+
+    ###############################################################################
+    # call the SLSQP optimizer ---------------------------------------------------#
+    #options = {'maxiter': 5,
+    #             'disp' : True}
+    #res = minimize(obj_f, x0, method='SLSQP', constraints=ineq_cons, bounds=bounds, 
+      #               options=options, callback=callbackF)
+    # end call to the SLSQP optimizer --------------------------------------------#
+    ###############################################################################
+
+    ###############################################################################
+    # call the differential evolution optimizer ----------------------------------#
+    popsize=5 # define the population size
+    maxiter=5 # define the maximum number of iterations
+    seed=1 # fixed, so a rerun asks for the same designs and finds them in the store
+    # vectorized=True hands each generation to the evaluator in one call (for
+    # the objective and the constraints), which simulates its designs on all
+    # cores. updating='deferred' is what makes a generation independent of the
+    # order its designs are evaluated in, so the result is the same as with
+    # evaluator.workers = map (serial).
+    with Pool() as pool:
+        evaluator.workers = pool.map
+        res = differential_evolution(obj_f, bounds=bounds, constraints=nonlinear_constraint, popsize=popsize, maxiter=maxiter, disp=True, polish = False,
+                                     vectorized=True, updating='deferred', seed=seed)
+        evaluator.workers = map
+    # end call the differential evolution optimizer ------------------------------#
+    ###############################################################################
+
+    ###############################################################################
+    # call the surrogate-assisted optimizer --------------------------------------#
+    # RBF surrogates of the objective and constraints pick the designs to
+    # simulate; plain differential_evolution with the same population size and
+    # number of generations may need popsize*len(x0)*(maxiter+1) simulations
+    #popsize=5 # population size of the differential_evolution to compare with
+    #maxiter=5 # generations of the differential_evolution to compare with
+    #max_evaluations=40 # true evaluations allowed
+    #with Pool() as pool:
+    #    evaluator.workers = pool.map
+    #    res = surrogate_optimize(evaluator, bounds, max_evaluations=max_evaluations, seed=1)
+    #    evaluator.workers = map
+    #de_evaluations = popsize*len(x0)*(maxiter+1)
+    #print('True evaluations = {} (simulated {}), differential_evolution: up to {}, saved {}'.format(
+    #      res.nfev, res.nsim, de_evaluations, de_evaluations - res.nfev))
+    # end call to the surrogate-assisted optimizer -------------------------------#
+    ###############################################################################
+
+    ###############################################################################
+    # call the COBYLA optimizer --------------------------------------------------#
+    # cobyla_bounds = [[14, 19], [0.2, 0.7], [250, 800], [0.05, 0.12], [100, 290]]
+    # #construct the bounds in the form of constraints
+    # cons_cobyla = []
+    # for factor in range(len(cobyla_bounds)):
+        # lower, upper = cobyla_bounds[factor]
+        # l = {'type': 'ineq',
+              # 'fun': lambda x, lb=lower, i=factor: x[i] - lb}
+        # u = {'type': 'ineq',
+              # 'fun': lambda x, ub=upper, i=factor: ub - x[i]}
+        # cons_cobyla.append(l)
+        # cons_cobyla.append(u)
+        # cons_cobyla.append(ineq_cons)  # the rest of the constraints
+    # options = {'maxiter': 50, 
+                # 'disp' : True}
+    # res = minimize(obj_f, x0, method='COBYLA', constraints=cons_cobyla, options=options)
+    # end call to the COBYLA optimizer -------------------------------------------#
+    ###############################################################################
+
+
+    print('Designs simulated = {} ({} EDL runs, {} rover runs)'.format(
+          evaluator.num_simulations, evaluator.num_edl_simulations,
+          evaluator.num_rover_simulations))
+
+    # check if we have a feasible solution 
+    c = evaluator.constraints(res.x)
+    
+    # the optimization is done; release the store file
+    evaluator.close()
+
+    feasible = np.max(c - np.zeros(len(c))) <= 0
+    if feasible:
+        xbest = res.x
+        fbest = res.fun
+    else:  # nonsense to let us know this did not work
+        xbest = [99999, 99999, 99999, 99999, 99999]
+        fval = [99999]
+        raise Exception('Solution not feasible, exiting code...')
+        sys.exit()
+
+    # What about the design variable bounds?
+
+    # The following will rerun your best design and present useful information
+    # about the performance of the design
+    # This will be helpful if you choose to create a loop around your optimizers and their initializations
+    # to try different starting points for the optimization.
+    edl_system = redefine_edl_system(edl_system)
+
+    edl_system['parachute']['diameter'] = xbest[0]
+    edl_system['rover']['wheel_assembly']['wheel']['radius'] = xbest[1]
+    edl_system['rover']['chassis']['mass'] = xbest[2]
+    edl_system['rover']['wheel_assembly']['speed_reducer']['diam_gear'] = xbest[3]
+    edl_system['rocket']['initial_fuel_mass'] = xbest[4]
+    edl_system['rocket']['fuel_mass'] = xbest[4]
+
+    # *****************************************************************************
+    # These lines save your design for submission for the rover competition.
+    # You will want to change them to match your team information.
+
+    edl_system['team_name'] = 'FunTeamName'  # change this to something fun for your team (or just your team number)
+    edl_system['48'] = 48    # change this to your assigned team number (also change it below when saving your pickle file)
+
+    # This will create a file that you can submit as your competition file.
+    with open('SP26_501team48.pickle', 'wb') as handle:
+        pickle.dump(edl_system, handle, protocol=pickle.HIGHEST_PROTOCOL)
+    # *****************************************************************************
+
+    #del edl_system
+    #with open('challenge_design_team9999.pickle', 'rb') as handle:
+    #    edl_system = pickle.load(handle)
+
+    time_edl_run,_,edl_system = simulate_edl(edl_system,planet,mission_events,tmax,True)
+    time_edl = time_edl_run[-1]
+
+    edl_system['rover'] = simulate_rover(edl_system['rover'],planet,experiment,end_event)
+    time_rover = edl_system['rover']['telemetry']['completion_time']
+
+    total_time = time_edl + time_rover
  
-edl_system_total_cost=get_cost_edl(edl_system)
-
-print('----------------------------------------')
-print('----------------------------------------')
-print('Optimized parachute diameter   = {:.6f} [m]'.format(xbest[0]))
-print('Optimized rocket fuel mass     = {:.6f} [kg]'.format(xbest[4]))
-print('Time to complete EDL mission   = {:.6f} [s]'.format(time_edl))
-print('Rover velocity at landing      = {:.6f} [m/s]'.format(edl_system['rover_touchdown_speed']))
-print('Optimized wheel radius         = {:.6f} [m]'.format(xbest[1])) 
-print('Optimized d2                   = {:.6f} [m]'.format(xbest[3])) 
-print('Optimized chassis mass         = {:.6f} [kg]'.format(xbest[2]))
-print('Time to complete rover mission = {:.6f} [s]'.format(time_rover))
-print('Time to complete mission       = {:.6f} [s]'.format(total_time))
-print('Average velocity               = {:.6f} [m/s]'.format(edl_system['rover']['telemetry']['average_velocity']))
-print('Distance traveled              = {:.6f} [m]'.format(edl_system['rover']['telemetry']['distance_traveled']))
-print('Battery energy per meter       = {:.6f} [J/m]'.format(edl_system['rover']['telemetry']['energy_per_distance']))
-print('Total cost                     = {:.6f} [$]'.format(edl_system_total_cost))
-print('----------------------------------------')
-print('----------------------------------------')
+    edl_system_total_cost=get_cost_edl(edl_system)
+
+    print('----------------------------------------')
+    print('----------------------------------------')
+    print('Optimized parachute diameter   = {:.6f} [m]'.format(xbest[0]))
+    print('Optimized rocket fuel mass     = {:.6f} [kg]'.format(xbest[4]))
+    print('Time to complete EDL mission   = {:.6f} [s]'.format(time_edl))
+    print('Rover velocity at landing      = {:.6f} [m/s]'.format(edl_system['rover_touchdown_speed']))
+    print('Optimized wheel radius         = {:.6f} [m]'.format(xbest[1])) 
+    print('Optimized d2                   = {:.6f} [m]'.format(xbest[3])) 
+    print('Optimized chassis mass         = {:.6f} [kg]'.format(xbest[2]))
+    print('Time to complete rover mission = {:.6f} [s]'.format(time_rover))
+    print('Time to complete mission       = {:.6f} [s]'.format(total_time))
+    print('Average velocity               = {:.6f} [m/s]'.format(edl_system['rover']['telemetry']['average_velocity']))
+    print('Distance traveled              = {:.6f} [m]'.format(edl_system['rover']['telemetry']['distance_traveled']))
+    print('Battery energy per meter       = {:.6f} [J/m]'.format(edl_system['rover']['telemetry']['energy_per_distance']))
+    print('Total cost                     = {:.6f} [$]'.format(edl_system_total_cost))
+    print('----------------------------------------')
+    print('----------------------------------------')
 
@@ -2,9 +2,13 @@ import numpy as np
 np.NaN = np.nan
 
 import matplotlib.pyplot as plt
-from scipy.interpolate import PchipInterpolator as pchip
 from scipy.integrate import solve_ivp
 
+# Mach-dependent drag (speed of sound, MEF data and the tabulated drag
+# model) is shared with Sec501Team48code
+from Sec501Team48code import (MEF_M_DATA, MEF_DATA, TabulatedMachDrag,
+                              F_drag_descent_Mach, mach_efficiency_factor)
+
 
 # =========================
 # Dictionary setup
@@ -199,63 +203,35 @@ def F_gravity_descent(edl_system, planet):
     return get_mass_edl(edl_system) * planet['g']
 
 
-def v2M_Mars(v, a):
-    SPD_data = np.array([
-        [0, 244.4], [1000, 243.7], [2000, 243.2], [3000, 242.7], [4000, 242.2],
-        [5000, 241.7], [6000, 241.2], [7000, 240.7], [8000, 239.6], [9000, 238.4],
-        [10000, 237.3], [11000, 236.1], [12000, 235.0], [13000, 233.8], [14000, 232.6]
-    ])
-    v_sound_fit = pchip(SPD_data[:, 0], SPD_data[:, 1])
-    v_sound = v_sound_fit(a)
-    return abs(v) / v_sound
-
-def mach_efficiency_factor(M):
-    """
-    Returns parachute Mach efficiency factor MEF(M) using shape-preserving
-    interpolation of the given experimental data.
-    """
-
-    M_data = np.array([0.25, 0.5, 0.65, 0.7, 0.8, 0.9, 0.95, 1.0,
-                       1.1, 1.2, 1.3, 1.4, 1.5, 1.6, 1.8, 1.9,
-                       2.0, 2.2, 2.5, 2.6])
-
-    MEF_data = np.array([1.0, 1.0, 1.0, 0.97, 0.91, 0.72, 0.66, 0.75,
-                         0.90, 0.96, 0.990, 0.999, 0.992, 0.98, 0.91, 0.85,
-                         0.82, 0.75, 0.64, 0.62])
-
-    mef_fit = pchip(M_data, MEF_data)
-
-    # Clip Mach number to data range so we do not rely on uncontrolled extrapolation
-    M = np.clip(M, M_data[0], M_data[-1])
+# Drag models by name, for edl_dynamics / simulate_edl. A drag model is any
+# callable with the F_drag_descent signature
+# (edl_system, planet, altitude, velocity) -> drag force [N]; other Cd
+# tables can be passed as TabulatedMachDrag(M_data, factor_data).
+DRAG_MODELS = {
+    'constant_cd': F_drag_descent,
+    'mach': F_drag_descent_Mach,
+}
 
-    return mef_fit(M)
-
-def F_drag_descent_Mach(edl_system, planet, altitude, velocity):
+def get_drag_model(drag_model, edl_system):
     """
-    Drag model with Mach-dependent parachute drag coefficient.
-    Uses Cd_mod = MEF(M) * Cd for the parachute only.
+    Resolves the drag_model argument of edl_dynamics / simulate_edl: a name
+    from DRAG_MODELS, a callable, or None for the old behavior (Mach model
+    if edl_system['parachute']['use_mach_model'] is set, constant Cd
+    otherwise).
     """
 
-    density, _, _ = get_local_atm_properties(planet, altitude)
-    rhov2 = 0.5 * density * velocity**2
+    if drag_model is None:
+        if edl_system['parachute'].get('use_mach_model', False):
+            return F_drag_descent_Mach
+        return F_drag_descent
 
-    # Body drag
-    if not edl_system['heat_shield']['ejected']:
-        ACd_body = np.pi * (edl_system['heat_shield']['diameter'] / 2.0)**2 * edl_system['heat_shield']['Cd']
-    else:
-        ACd_body = edl_system['sky_crane']['area'] * edl_system['sky_crane']['Cd']
+    if callable(drag_model):
+        return drag_model
 
-    # Parachute drag
-    if edl_system['parachute']['deployed'] and not edl_system['parachute']['ejected']:
-        M = v2M_Mars(velocity, altitude)
-        MEF = mach_efficiency_factor(M)
-        Cd_mod = MEF * edl_system['parachute']['Cd']
-        ACd_parachute = np.pi * (edl_system['parachute']['diameter'] / 2.0)**2 * Cd_mod
-    else:
-        ACd_parachute = 0.0
+    if drag_model in DRAG_MODELS:
+        return DRAG_MODELS[drag_model]
 
-    F = rhov2 * (ACd_body + ACd_parachute)
-    return F
+    raise Exception("drag_model must be None, a callable or one of {}".format(list(DRAG_MODELS)))
 
 # =========================
 # Simulation functions
@@ -301,7 +277,7 @@ def edl_events(edl_system, mission_events):
     return [event0, event1, event2, event3, event4, event5, event6, event7, event8]
 
 
-def edl_dynamics(t, y, edl_system, planet):
+def edl_dynamics(t, y, edl_system, planet, drag_model=None):
     vel_edl = y[0]
     altitude_edl = y[1]
     fuel_mass = y[2]
@@ -313,10 +289,7 @@ def edl_dynamics(t, y, edl_system, planet):
     edl_system['rocket']['fuel_mass'] = fuel_mass / edl_system['num_rockets']
     edl_mass = get_mass_edl(edl_system)
 
-    if edl_system['parachute'].get('use_mach_model', False):
-        F_drag = F_drag_descent_Mach(edl_system, planet, altitude_edl, vel_edl)
-    else:
-        F_drag = F_drag_descent(edl_system, planet, altitude_edl, vel_edl)
+    F_drag = get_drag_model(drag_model, edl_system)(edl_system, planet, altitude_edl, vel_edl)
 
     F_ext = F_gravity_descent(edl_system, planet) + \
         F_buoyancy_descent(edl_system, planet, altitude_edl) + \
@@ -458,7 +431,11 @@ def update_edl_state(edl_system, TE, YE, Y, ITER_INFO):
     return edl_system, y0, TERMINATE_SIM
 
 
-def simulate_edl(edl_system, planet, mission_events, tmax, ITER_INFO):
+def simulate_edl(edl_system, planet, mission_events, tmax, ITER_INFO, drag_model=None):
+    # drag_model: see get_drag_model. Chosen per call, so simulations with
+    # different drag models can run side by side.
+    drag_model = get_drag_model(drag_model, edl_system)
+
     events = edl_events(edl_system, mission_events)
     tspan = (0, tmax)
 
@@ -472,12 +449,13 @@ def simulate_edl(edl_system, planet, mission_events, tmax, ITER_INFO):
         0
     ])
 
-    T = np.array([])
-    Y = np.array([[], [], [], [], [], [], []])
+    # one piece per stage, joined once at the end
+    T_parts = []
+    Y_parts = []
     TERMINATE_SIM = False
 
     while not TERMINATE_SIM:
-        fun = lambda t, y: edl_dynamics(t, y, edl_system, planet)
+        fun = lambda t, y: edl_dynamics(t, y, edl_system, planet, drag_model)
         sol = solve_ivp(fun, tspan, y0, method='DOP853', events=events, max_step=0.1)
 
         t_part = sol.t
@@ -489,12 +467,15 @@ def simulate_edl(edl_system, planet, mission_events, tmax, ITER_INFO):
 
         tspan = (t_part[-1], tmax)
 
-        T = np.append(T, t_part)
-        Y = np.hstack((Y, Y_part))
+        T_parts.append(t_part)
+        Y_parts.append(Y_part)
 
         if tspan[0] >= tspan[1]:
             TERMINATE_SIM = True
 
+    T = np.concatenate(T_parts)
+    Y = np.concatenate(Y_parts, axis=1)
+
     return T, Y, edl_system
 
 
@@ -2,41 +2,13 @@ import numpy as np
 np.NaN = np.nan
 
 import matplotlib.pyplot as plt
-from scipy.interpolate import PchipInterpolator as pchip
 
-from define_edl_system import define_edl_system_1
-from define_planet import define_planet
-from define_mission_events import define_mission_events
-import subfunctions_EDL as sf
+import study_parachute_size as sf
+from study_parachute_size import define_edl_system_1, define_planet, define_mission_events
 
-
-# -------------------------------------------------
-# Task 6: Mach efficiency factor model
-# -------------------------------------------------
-def mach_efficiency_factor(M):
-    """
-    Returns MEF(M) using shape-preserving interpolation of the
-    experimental data from the assignment.
-    """
-
-    M_data = np.array([
-        0.25, 0.5, 0.65, 0.7, 0.8, 0.9, 0.95, 1.0,
-        1.1, 1.2, 1.3, 1.4, 1.5, 1.6, 1.8, 1.9,
-        2.0, 2.2, 2.5, 2.6
-    ])
-
-    MEF_data = np.array([
-        1.0, 1.0, 1.0, 0.97, 0.91, 0.72, 0.66, 0.75,
-        0.90, 0.96, 0.990, 0.999, 0.992, 0.98, 0.91, 0.85,
-        0.82, 0.75, 0.64, 0.62
-    ])
-
-    fit = pchip(M_data, MEF_data)
-
-    # clip to the tabulated Mach range
-    M = np.clip(M, M_data[0], M_data[-1])
-
-    return fit(M)
+# Task 6 MEF model: shape-preserving fit of the assignment data, shared with
+# study_parachute_size so the data and the fit live in one place.
+from study_parachute_size import mach_efficiency_factor
 
 
 # -------------------------------------------------
@@ -67,7 +39,8 @@ def run_study_constant_cd():
         edl_system['rover']['on_ground'] = False
         edl_system['parachute']['diameter'] = D
 
-        t, Y, edl_system = sf.simulate_edl(edl_system, mars, mission_events, 2000, False)
+        t, Y, edl_system = sf.simulate_edl(edl_system, mars, mission_events, 2000, False,
+                                           drag_model='constant_cd')
 
         t_end = t[-1]
         rover_v_ground = Y[0, -1] + Y[5, -1]
@@ -93,35 +66,8 @@ def run_study_constant_cd():
 # -------------------------------------------------
 # Task 6 Mach-dependent drag study
 # -------------------------------------------------
-def F_drag_descent_mach(edl_system, planet, altitude, velocity):
-    """
-    Revised drag model:
-    Cd_mod = MEF(M) * Cd
-    applies to parachute drag only.
-    """
-
-    density, _, _ = sf.get_local_atm_properties(planet, altitude)
-    rhov2 = 0.5 * density * velocity**2
-
-    # body drag
-    if not edl_system['heat_shield']['ejected']:
-        ACd_body = np.pi * (edl_system['heat_shield']['diameter'] / 2.0)**2 * edl_system['heat_shield']['Cd']
-    else:
-        ACd_body = edl_system['sky_crane']['area'] * edl_system['sky_crane']['Cd']
-
-    # parachute drag
-    if edl_system['parachute']['deployed'] and not edl_system['parachute']['ejected']:
-        M = sf.v2M_Mars(velocity, altitude)
-        MEF = mach_efficiency_factor(M)
-        Cd_mod = MEF * edl_system['parachute']['Cd']
-        ACd_parachute = np.pi * (edl_system['parachute']['diameter'] / 2.0)**2 * Cd_mod
-    else:
-        ACd_parachute = 0.0
-
-    F = rhov2 * (ACd_body + ACd_parachute)
-    return F
-
-
+# The revised drag model (Cd_mod = MEF(M) * Cd, parachute only) is
+# study_parachute_size's 'mach' drag model
 def run_study_mach_model():
     diameters = np.arange(14.0, 19.0 + 0.001, 0.5)
 
@@ -129,47 +75,39 @@ def run_study_mach_model():
     rover_speed_term = []
     landing_success = []
 
-    # temporarily replace the drag model inside subfunctions_EDL
-    original_drag_function = sf.F_drag_descent
-    sf.F_drag_descent = F_drag_descent_mach
-
-    try:
-        for D in diameters:
-            edl_system = define_edl_system_1()
-            mars = define_planet()
-            mission_events = define_mission_events()
-
-            # required initial conditions
-            edl_system['altitude'] = 11000
-            edl_system['velocity'] = -590
-            edl_system['rocket']['on'] = False
-            edl_system['parachute']['deployed'] = True
-            edl_system['parachute']['ejected'] = False
-            edl_system['heat_shield']['ejected'] = False
-            edl_system['sky_crane']['on'] = False
-            edl_system['speed_control']['on'] = False
-            edl_system['position_control']['on'] = False
-            edl_system['rover']['on_ground'] = False
-            edl_system['parachute']['diameter'] = D
-
-            t, Y, edl_system = sf.simulate_edl(edl_system, mars, mission_events, 2000, False)
-
-            t_end = t[-1]
-            rover_v_ground = Y[0, -1] + Y[5, -1]
-
-            success = int(
-                edl_system['rover']['on_ground']
-                and abs(rover_v_ground) <= abs(edl_system['sky_crane']['danger_speed'])
-                and Y[1, -1] >= edl_system['sky_crane']['danger_altitude']
-            )
-
-            sim_time.append(t_end)
-            rover_speed_term.append(rover_v_ground)
-            landing_success.append(success)
-
-    finally:
-        # restore original function so old behavior remains intact
-        sf.F_drag_descent = original_drag_function
+    for D in diameters:
+        edl_system = define_edl_system_1()
+        mars = define_planet()
+        mission_events = define_mission_events()
+
+        # required initial conditions
+        edl_system['altitude'] = 11000
+        edl_system['velocity'] = -590
+        edl_system['rocket']['on'] = False
+        edl_system['parachute']['deployed'] = True
+        edl_system['parachute']['ejected'] = False
+        edl_system['heat_shield']['ejected'] = False
+        edl_system['sky_crane']['on'] = False
+        edl_system['speed_control']['on'] = False
+        edl_system['position_control']['on'] = False
+        edl_system['rover']['on_ground'] = False
+        edl_system['parachute']['diameter'] = D
+
+        t, Y, edl_system = sf.simulate_edl(edl_system, mars, mission_events, 2000, False,
+                                           drag_model='mach')
+
+        t_end = t[-1]
+        rover_v_ground = Y[0, -1] + Y[5, -1]
+
+        success = int(
+            edl_system['rover']['on_ground']
+            and abs(rover_v_ground) <= abs(edl_system['sky_crane']['danger_speed'])
+            and Y[1, -1] >= edl_system['sky_crane']['danger_altitude']
+        )
+
+        sim_time.append(t_end)
+        rover_speed_term.append(rover_v_ground)
+        landing_success.append(success)
 
     return (
         diameters,
@@ -190,17 +128,8 @@ def main():
     # -----------------------------
     # Plot 1: MEF vs Mach
     # -----------------------------
-    M_data = np.array([
-        0.25, 0.5, 0.65, 0.7, 0.8, 0.9, 0.95, 1.0,
-        1.1, 1.2, 1.3, 1.4, 1.5, 1.6, 1.8, 1.9,
-        2.0, 2.2, 2.5, 2.6
-    ])
-
-    MEF_data = np.array([
-        1.0, 1.0, 1.0, 0.97, 0.91, 0.72, 0.66, 0.75,
-        0.90, 0.96, 0.990, 0.999, 0.992, 0.98, 0.91, 0.85,
-        0.82, 0.75, 0.64, 0.62
-    ])
+    M_data = sf.MEF_M_DATA
+    MEF_data = sf.MEF_DATA
 
     M_plot = np.linspace(0.25, 2.6, 400)
     MEF_plot = mach_efficiency_factor(M_plot)
@@ -46,9 +46,10 @@ def get_gear_ratio(speed_reducer):
 #----------------------------------------------------------------------------#
 import numpy as np
 
-def tau_dcmotor(omega, motor):
+def _check_motor(motor):
     """
-    Returns motor shaft torque given motor shaft speed and motor parameters.
+    Validates a motor dictionary and returns its torque-speed curve
+    parameters (torque_stall, torque_noload, speed_noload) as floats.
     """
 
     # ---------------------------
@@ -80,6 +81,14 @@ def tau_dcmotor(omega, motor):
     if tau_s < tau_nl:
         raise Exception("torque_stall must be >= torque_noload.")
 
+    return tau_s, tau_nl, omega_nl
+
+
+def _check_omega(omega):
+    """
+    Validates a motor shaft speed input and returns it as a float array.
+    """
+
     # ---------------------------
     # Validate omega
     # ---------------------------
@@ -98,6 +107,17 @@ def tau_dcmotor(omega, motor):
     if np.any(~np.isfinite(omega_array)):
         raise Exception("omega values must be finite real numbers.")
 
+    return omega_array
+
+
+def _tau_dcmotor_unchecked(omega, tau_s, tau_nl, omega_nl):
+    """
+    Torque calculation of tau_dcmotor with no input checking. Always
+    returns a numpy array (0-D for scalar omega).
+    """
+
+    omega_array = np.asarray(omega, dtype=float)
+
     # ---------------------------
     # Torque calculation
     # ---------------------------
@@ -113,6 +133,19 @@ def tau_dcmotor(omega, motor):
     # omega > omega_nl -> 0 torque
     tau[omega_array > omega_nl] = 0.0
 
+    return tau
+
+
+def tau_dcmotor(omega, motor):
+    """
+    Returns motor shaft torque given motor shaft speed and motor parameters.
+    """
+
+    tau_s, tau_nl, omega_nl = _check_motor(motor)
+    omega_array = _check_omega(omega)
+
+    tau = _tau_dcmotor_unchecked(omega_array, tau_s, tau_nl, omega_nl)
+
     # Return scalar if scalar output
     if np.size(tau) == 1:
         return tau.item()
@@ -144,35 +177,44 @@ def F_drive(omega, rover):
     if not isinstance(rover, dict):
         raise Exception("rover must be a dictionary.")
 
-    # Convert omega to numpy array for vectorized operations
-    omega_array = np.array(omega, copy=False)
-
     # Extract sub-dictionaries
     wheel_assembly = rover['wheel_assembly']
     motor = wheel_assembly['motor']
     speed_reducer = wheel_assembly['speed_reducer']
     wheel = wheel_assembly['wheel']
 
-    # --- Motor torque ---
-    tau_motor = tau_dcmotor(omega_array, motor)
+    tau_s, tau_nl, omega_nl = _check_motor(motor)
+    omega_array = _check_omega(omega)
 
     # --- Speed reducer ---
     Ng = get_gear_ratio(speed_reducer)
 
+    Fd = _F_drive_unchecked(omega_array, tau_s, tau_nl, omega_nl, Ng, wheel['radius'])
+
+    # Return scalar if scalar output
+    if np.size(Fd) == 1:
+        return Fd.item()
+
+    return Fd
+
+
+def _F_drive_unchecked(omega, tau_s, tau_nl, omega_nl, Ng, r):
+    """
+    Drive force calculation of F_drive with no input checking.
+    """
+
+    # --- Motor torque ---
+    tau_motor = _tau_dcmotor_unchecked(omega, tau_s, tau_nl, omega_nl)
+
     # Torque at wheel axle
     tau_wheel = Ng * tau_motor
 
     # --- Wheel force (per wheel) ---
-    r = wheel['radius']
     F_wheel = tau_wheel / r
 
     # --- Total drive force (6 wheels) ---
     Fd = 6 * F_wheel
 
-    # Return scalar if input was scalar
-    if np.isscalar(omega):
-        return float(Fd)
-
     return Fd
 
 #----------------------------------------------------------------------------#
@@ -209,11 +251,7 @@ def F_gravity(terrain_angle, rover, planet):
     m = get_mass(rover)
     g = planet['g']
 
-    # Convert degrees to radians
-    angle_rad = np.deg2rad(angle_array)
-
-    # Calculate Force
-    Fgt = -m * g * np.sin(angle_rad)
+    Fgt = _F_gravity_unchecked(angle_array, m, g)
 
     # --- Return Handling ---
     if angle_array.ndim == 0:
@@ -222,10 +260,24 @@ def F_gravity(terrain_angle, rover, planet):
         return Fgt
 
 
+def _F_gravity_unchecked(terrain_angle, m, g):
+    """
+    Gravity force calculation of F_gravity with no input checking.
+    """
+
+    # Convert degrees to radians
+    angle_rad = np.deg2rad(terrain_angle)
+
+    # Calculate Force
+    Fgt = -m * g * np.sin(angle_rad)
+
+    return Fgt
+
+
 #----------------------------------------------------------------------------#
 
 import numpy as np
-import math
+from scipy.special import erf
 
 def F_rolling(omega, terrain_angle, rover, planet, Crr):
     # --- Input validation ---
@@ -246,28 +298,37 @@ def F_rolling(omega, terrain_angle, rover, planet, Crr):
     # --- Physics ---
     m = get_mass(rover)
     g = planet['g']
-    angle_rad = np.deg2rad(angle_arr)
-    
-    # Normal Force: Fn = m * g * cos(alpha)
-    Fn = m * g * np.cos(angle_rad)
-    Frr_simple = Crr * Fn
-
-    # Velocity: v = r * (omega / Ng)
     wa = rover['wheel_assembly']
     r = wa['wheel']['radius']
     Ng = get_gear_ratio(wa['speed_reducer'])
-    v_rover = r * (omega_arr / Ng)
 
-    # Use vectorized math.erf to handle arrays
-    v_erf = np.vectorize(math.erf)
-    # Rolling resistance opposes motion: -erf(40v) * Frr_simple
-    Frr = -v_erf(40 * v_rover) * Frr_simple
+    Frr = _F_rolling_unchecked(omega_arr, angle_arr, m, g, r, Ng, Crr)
 
     # Mirror input type: return scalar if input was scalar
     if np.ndim(omega) == 0:
         return float(Frr)
     return Frr
 
+
+def _F_rolling_unchecked(omega, terrain_angle, m, g, r, Ng, Crr):
+    """
+    Rolling resistance calculation of F_rolling with no input checking.
+    """
+
+    angle_rad = np.deg2rad(terrain_angle)
+
+    # Normal Force: Fn = m * g * cos(alpha)
+    Fn = m * g * np.cos(angle_rad)
+    Frr_simple = Crr * Fn
+
+    # Velocity: v = r * (omega / Ng)
+    v_rover = r * (omega / Ng)
+
+    # Rolling resistance opposes motion: -erf(40v) * Frr_simple
+    Frr = -erf(40 * v_rover) * Frr_simple
+
+    return Frr
+
 #----------------------------------------------------------------------------#
 def F_net(omega, terrain_angle, rover, planet, Crr):
     """
@@ -281,6 +342,9 @@ def F_net(omega, terrain_angle, rover, planet, Crr):
     angle_array = np.asarray(terrain_angle)
 
     # --- Input validation ---
+    # This is the only validation on this path: the force components are
+    # computed with the unchecked kernels, so everything F_drive, F_gravity
+    # and F_rolling would have checked is checked here, once.
     if omega_array.shape != angle_array.shape:
         raise Exception("omega and terrain_angle must be the same size.")
 
@@ -290,23 +354,58 @@ def F_net(omega, terrain_angle, rover, planet, Crr):
     if not isinstance(planet, dict):
         raise Exception("planet must be a dictionary.")
 
+    if 'g' not in planet:
+        raise Exception("planet dictionary must contain gravity field 'g'.")
+
     if not np.isscalar(Crr) or Crr <= 0:
         raise Exception("Crr must be a positive scalar.")
 
+    try:
+        angle_array = np.asarray(terrain_angle, dtype=float)
+    except:
+        raise Exception("terrain_angle must be a scalar or vector of numbers.")
+
     if np.any(angle_array < -75) or np.any(angle_array > 75):
         raise Exception("terrain_angle must be between -75 and +75 degrees.")
 
-    # --- Force components ---
-    Fd = F_drive(omega_array, rover)
-    Fg = F_gravity(angle_array, rover, planet)
-    Fr = F_rolling(omega_array, angle_array, rover, planet, Crr)
+    omega_array = _check_omega(omega_array)
+    wa = rover['wheel_assembly']
+    tau_s, tau_nl, omega_nl = _check_motor(wa['motor'])
+    params = RoverParams(
+        mass=get_mass(rover),
+        Ng=get_gear_ratio(wa['speed_reducer']),
+        r=wa['wheel']['radius'],
+        tau_s=tau_s,
+        tau_nl=tau_nl,
+        omega_nl=omega_nl,
+        effcy_fun=None
+    )
 
-    # Force result to be numpy-compatible (prevents python-float .item() crash)
-    Fnet = np.asarray(Fd) + np.asarray(Fg) + np.asarray(Fr)
+    Fnet = _F_net_unchecked(omega_array, angle_array, params, planet['g'], Crr)
 
     # Return scalar if scalar input, else return array
     if Fnet.size == 1:
-        return float(Fnet)          
+        return Fnet.item()
+
+    return Fnet
+
+
+def _F_net_unchecked(omega, terrain_angle, params, g, Crr):
+    """
+    Net force calculation of F_net with no input checking. params is a
+    RoverParams record (see compile_rover); its efficiency spline is not
+    used.
+    """
+
+    p = params
+
+    # --- Force components ---
+    Fd = _F_drive_unchecked(omega, p.tau_s, p.tau_nl, p.omega_nl, p.Ng, p.r)
+    Fg = _F_gravity_unchecked(terrain_angle, p.mass, g)
+    Fr = _F_rolling_unchecked(omega, terrain_angle, p.mass, g, p.r, p.Ng, Crr)
+
+    # Force result to be numpy-compatible (prevents python-float .item() crash)
+    Fnet = np.asarray(Fd) + np.asarray(Fg) + np.asarray(Fr)
 
     return Fnet
 
@@ -450,6 +549,19 @@ def motorW(v, rover):
     else:
         raise Exception("v must be a scalar or a 1D numpy array.")
 
+    Ng, r = _check_wheel_drive(rover)
+
+    w = _motorW_unchecked(v_array, Ng, r)
+
+    return w
+
+
+def _check_wheel_drive(rover):
+    """
+    Validates the wheel and speed reducer entries of a rover dictionary and
+    returns the gear ratio and wheel radius.
+    """
+
     # Check rover dictionary structure
     if 'wheel_assembly' not in rover:
         raise Exception("rover dictionary must contain 'wheel_assembly'.")
@@ -471,8 +583,16 @@ def motorW(v, rover):
     # Get gear ratio from helper function
     Ng = get_gear_ratio(rover['wheel_assembly']['speed_reducer'])
 
+    return Ng, r
+
+
+def _motorW_unchecked(v, Ng, r):
+    """
+    Motor speed calculation of motorW with no input checking.
+    """
+
     # Wheel angular speed [rad/s]
-    w_wheel = v_array / r
+    w_wheel = v / r
 
     # Motor angular speed [rad/s]
     w = Ng * w_wheel
@@ -482,7 +602,60 @@ def motorW(v, rover):
 import numpy as np
 from scipy.interpolate import interp1d
 
-def rover_dynamics(t, y, rover, planet, experiment):
+# The constant-parameter record and the terrain spline are shared with
+# Sec501Team48code, so both rover models run on the same implementation
+from Sec501Team48code import RoverParams, TerrainProfile
+
+
+def compile_rover(rover):
+    """
+    Pulls the constant rover quantities out of the nested rover dictionary
+    once, so the ODE right-hand side does not re-walk it (or re-sum the
+    subsystem masses) on every call. The rover dictionary is validated here,
+    so the record can be handed to the unchecked force kernels.
+
+    Parameters
+    ----------
+    rover : dict
+        Dictionary containing rover parameters
+
+    Returns
+    -------
+    params : RoverParams
+        Mass, gear ratio, wheel radius, motor curve and efficiency spline
+    """
+
+    if not isinstance(rover, dict):
+        raise Exception("rover must be a dictionary.")
+
+    # Everything the unchecked kernels rely on is validated here
+    Ng, r = _check_wheel_drive(rover)
+    motor = rover['wheel_assembly']['motor']
+    tau_s, tau_nl, omega_nl = _check_motor(motor)
+
+    if 'effcy_tau' in motor and 'effcy' in motor:
+        effcy_fun = interp1d(
+            motor['effcy_tau'],
+            motor['effcy'],
+            kind='cubic',
+            fill_value='extrapolate'
+        )
+    else:
+        effcy_fun = None
+
+    return RoverParams(
+        mass=get_mass(rover),
+        Ng=Ng,
+        r=r,
+        tau_s=tau_s,
+        tau_nl=tau_nl,
+        omega_nl=omega_nl,
+        effcy_fun=effcy_fun
+    )
+#--------------------------------------------------------------------------#
+import numpy as np
+
+def rover_dynamics(t, y, rover, planet, experiment, terrain=None, params=None):
     """
     Computes the derivative of the rover state vector for use with an ODE solver.
 
@@ -500,6 +673,12 @@ def rover_dynamics(t, y, rover, planet, experiment):
         Planet definition dictionary
     experiment : dict
         Experiment definition dictionary
+    terrain : TerrainProfile, optional
+        Terrain profile built from experiment. Built on the fly if not given.
+    params : RoverParams, optional
+        Output of compile_rover. When given, forces come from the unchecked
+        kernels, so the inputs must already have been validated (as
+        simulate_rover does).
 
     Returns
     -------
@@ -541,19 +720,20 @@ def rover_dynamics(t, y, rover, planet, experiment):
     x = y[1]   # position [m]
 
     # ----- Terrain interpolation -----
-    alpha_fun = interp1d(
-        experiment['alpha_dist'],
-        experiment['alpha_deg'],
-        kind='cubic',
-        fill_value='extrapolate'
-    )
+    if terrain is None:
+        terrain = TerrainProfile(experiment['alpha_dist'], experiment['alpha_deg'])
 
-    terrain_angle = float(alpha_fun(x))
+    terrain_angle = float(terrain(x))
 
     # ----- Helper functions already in subfunctions.py -----
-    w = motorW(v, rover)
-    F = F_net(w, terrain_angle, rover, planet, experiment['Crr'])
-    m = get_mass(rover)
+    if params is None:
+        w = motorW(v, rover)
+        F = F_net(w, terrain_angle, rover, planet, experiment['Crr'])
+        m = get_mass(rover)
+    else:
+        w = _motorW_unchecked(v, params.Ng, params.r)
+        F = _F_net_unchecked(w, terrain_angle, params, planet['g'], experiment['Crr'])
+        m = params.mass
 
     # ----- State derivatives -----
     dvdt = F / m
@@ -562,6 +742,66 @@ def rover_dynamics(t, y, rover, planet, experiment):
     dydt = np.array([dvdt, dxdt])
 
     return dydt
+
+
+def rover_jacobian(t, y, planet, experiment, terrain, params):
+    """
+    Analytic Jacobian of rover_dynamics with respect to y, for the implicit
+    solvers in simulate_rover. Differentiates the same model as
+    _F_net_unchecked, with no input checking.
+
+    Parameters
+    ----------
+    t : scalar
+        Time sample [s]
+    y : 1D numpy array
+        Two-element state vector [velocity, position]
+    planet : dict
+        Planet definition dictionary
+    experiment : dict
+        Experiment definition dictionary
+    terrain : TerrainProfile
+        Terrain profile built from experiment
+    params : RoverParams
+        Output of compile_rover
+
+    Returns
+    -------
+    J : 2x2 numpy array
+        d(dydt)/dy
+    """
+
+    v = float(y[0])
+    x = float(y[1])
+
+    m = params.mass
+    g = planet['g']
+    Crr = experiment['Crr']
+
+    angle = np.deg2rad(float(terrain(x)))
+    dangle_dx = np.deg2rad(float(terrain.derivative(x)))   # [rad/m]
+
+    # Drive force: slope of the motor curve, flat outside 0 <= omega <= omega_nl
+    omega = v * params.Ng / params.r
+    if 0 <= omega <= params.omega_nl:
+        dtau_domega = -(params.tau_s - params.tau_nl) / params.omega_nl
+    else:
+        dtau_domega = 0.0
+    dFd_dv = 6 * (params.Ng / params.r)**2 * dtau_domega
+
+    # Rolling resistance: Fr = -erf(40 v) * Crr * m * g * cos(angle)
+    dFr_dv = -80 / np.sqrt(np.pi) * np.exp(-(40 * v)**2) * Crr * m * g * np.cos(angle)
+    dFr_dangle = erf(40 * v) * Crr * m * g * np.sin(angle)
+
+    # Gravity: Fg = -m * g * sin(angle)
+    dFg_dangle = -m * g * np.cos(angle)
+
+    J = np.array([
+        [(dFd_dv + dFr_dv) / m, (dFr_dangle + dFg_dangle) * dangle_dx / m],
+        [1.0, 0.0]
+    ])
+
+    return J
 #------------------------------------------------------------------------#
 import numpy as np
 
@@ -598,8 +838,13 @@ def mechpower(v, rover):
     else:
         raise Exception("v must be a scalar or a 1D numpy array.")
 
-    w = motorW(v_array, rover)
-    tau = tau_dcmotor(w, rover['wheel_assembly']['motor'])
+    Ng, r = _check_wheel_drive(rover)
+    tau_s, tau_nl, omega_nl = _check_motor(rover['wheel_assembly']['motor'])
+
+    w = _motorW_unchecked(v_array, Ng, r)
+    tau = _tau_dcmotor_unchecked(_check_omega(w), tau_s, tau_nl, omega_nl)
+    if np.size(tau) == 1:
+        tau = tau.item()
     P = tau * w
 
     return P
@@ -607,7 +852,7 @@ def mechpower(v, rover):
 import numpy as np
 from scipy.interpolate import interp1d
 
-def battenergy(t, v, rover):
+def battenergy(t, v, rover, params=None):
     """
     Computes the total electrical energy consumed from the rover battery pack
     over a simulation profile.
@@ -620,6 +865,8 @@ def battenergy(t, v, rover):
         Rover velocity samples from rover simulation [m/s]
     rover : dict
         Dictionary containing rover parameters
+    params : RoverParams, optional
+        Output of compile_rover. Its efficiency spline is reused when given.
 
     Returns
     -------
@@ -650,25 +897,31 @@ def battenergy(t, v, rover):
     if np.any(np.diff(t) < 0):
         raise Exception("t must be in nondecreasing order.")
 
-    # ----- Mechanical power for one motor -----
-    P_mech = mechpower(v, rover)
+    Ng, r = _check_wheel_drive(rover)
+    motor = rover['wheel_assembly']['motor']
+    tau_s, tau_nl, omega_nl = _check_motor(motor)
 
     # ----- Motor speed and torque for one motor -----
-    w = motorW(v, rover)
-    tau = tau_dcmotor(w, rover['wheel_assembly']['motor'])
+    w = _motorW_unchecked(v, Ng, r)
+    tau = _tau_dcmotor_unchecked(_check_omega(w), tau_s, tau_nl, omega_nl)
+
+    # ----- Mechanical power for one motor -----
+    P_mech = tau * w
 
     # ----- Efficiency interpolation -----
-    motor = rover['wheel_assembly']['motor']
 
     if 'effcy_tau' not in motor or 'effcy' not in motor:
         raise Exception("Motor dictionary must contain 'effcy_tau' and 'effcy'.")
 
-    effcy_fun = interp1d(
-        motor['effcy_tau'],
-        motor['effcy'],
-        kind='cubic',
-        fill_value='extrapolate'
-    )
+    if params is not None and params.effcy_fun is not None:
+        effcy_fun = params.effcy_fun
+    else:
+        effcy_fun = interp1d(
+            motor['effcy_tau'],
+            motor['effcy'],
+            kind='cubic',
+            fill_value='extrapolate'
+        )
 
     eta = effcy_fun(tau)
 
@@ -716,9 +969,22 @@ def end_of_mission_event(end_event):
 import numpy as np
 from scipy.integrate import solve_ivp
 
-def simulate_rover(rover, planet, experiment, end_event):
+# solve_ivp presets for simulate_rover. The rover ODE is stiff, so the
+# presets use implicit methods and get the analytic rover_jacobian, as in
+# Sec501Team48code; profile=None keeps the original RK45 call.
+ROVER_SOLVER_PROFILES = {
+    'fast': {'method': 'LSODA', 'rtol': 1e-3, 'atol': 1e-6, 'max_step': np.inf},
+    'accurate': {'method': 'Radau', 'rtol': 1e-8, 'atol': 1e-10, 'max_step': 1.0},
+    'stiff': {'method': 'BDF', 'rtol': 1e-3, 'atol': 1e-6, 'max_step': 1.0}
+}
+
+def simulate_rover(rover, planet, experiment, end_event, profile=None):
     """
     Integrates the trajectory of a rover and populates rover['telemetry'].
+
+    profile selects the solve_ivp settings: None (RK45 with default
+    tolerances), the name of a preset in ROVER_SOLVER_PROFILES ('fast',
+    'accurate', 'stiff'), or a dict of solve_ivp options.
     """
 
     # Check inputs
@@ -731,6 +997,15 @@ def simulate_rover(rover, planet, experiment, end_event):
     if type(end_event) != dict:
         raise Exception('Fourth input must be a dict')
 
+    if profile is None:
+        options = {'method': 'RK45'}
+    elif type(profile) == dict:
+        options = dict(profile)
+    elif profile in ROVER_SOLVER_PROFILES:
+        options = dict(ROVER_SOLVER_PROFILES[profile])
+    else:
+        raise Exception("profile must be None, one of {} or a dict of solve_ivp options".format(list(ROVER_SOLVER_PROFILES)))
+
     # Pull simulation settings
     tspan = experiment['time_range']
     y0 = experiment['initial_conditions']
@@ -738,13 +1013,28 @@ def simulate_rover(rover, planet, experiment, end_event):
     # Event functions
     events = end_of_mission_event(end_event)
 
+    # Terrain spline and rover constants are fixed for the whole run, so
+    # build them once
+    terrain = TerrainProfile(experiment['alpha_dist'], experiment['alpha_deg'])
+    params = compile_rover(rover)
+
+    # rover_dynamics runs the unchecked kernels, so validate the force
+    # inputs once here: initial speed against every terrain angle given
+    alpha_deg = np.asarray(experiment['alpha_deg'], dtype=float)
+    w0 = motorW(float(y0[0]), rover)
+    F_net(np.full(alpha_deg.shape, w0), alpha_deg, rover, planet, experiment['Crr'])
+
+    # Saves the implicit solvers from finite-differencing the RHS
+    if options.get('method') in ('BDF', 'Radau', 'LSODA'):
+        options['jac'] = lambda t, y: rover_jacobian(t, y, planet, experiment, terrain, params)
+
     # Solve ODE
     sol = solve_ivp(
-        fun=lambda t, y: rover_dynamics(t, y, rover, planet, experiment),
+        fun=lambda t, y: rover_dynamics(t, y, rover, planet, experiment, terrain, params),
         t_span=(tspan[0], tspan[1]),
         y0=y0,
-        method='RK45',
-        events=events
+        events=events,
+        **options
     )
 
     # Extract solution
@@ -758,7 +1048,7 @@ def simulate_rover(rover, planet, experiment, end_event):
     max_velocity = np.max(velocity)
     average_velocity = distance_traveled / completion_time
     power = mechpower(velocity, rover)
-    battery_energy = battenergy(Time, velocity, rover)
+    battery_energy = battenergy(Time, velocity, rover, params)
     energy_per_distance = battery_energy / distance_traveled
 
     # Populate telemetry dictionary
@@ -772,7 +1062,8 @@ def simulate_rover(rover, planet, experiment, end_event):
         'average_velocity': average_velocity,
         'power': power,
         'battery_energy': battery_energy,
-        'energy_per_distance': energy_per_distance
+        'energy_per_distance': energy_per_distance,
+        'solver_nfev': sol.nfev
     }
 
     return rover